@@ -1,6 +1,7 @@
 import bpy
 from bpy.props import (BoolProperty,
                        FloatProperty,
+                       IntProperty,
                        StringProperty,
                        EnumProperty)
 from bpy_extras.io_utils import ExportHelper
@@ -44,6 +45,8 @@ class NTR_PT_export_imd(bpy.types.Panel):
         layout.prop(operator, 'imd_export')
         layout.prop(operator, 'imd_magnification')
         layout.prop(operator, 'imd_use_primitive_strip')
+        layout.prop(operator, 'imd_reorder_primitives')
+        layout.prop(operator, 'imd_mtx_list_size')
         layout.prop(operator, 'imd_compress_nodes')
 
 
@@ -134,6 +137,26 @@ class ExportNitro(bpy.types.Operator, ExportHelper):
     pretty_print: BoolProperty(name="Pretty print", default=True)
 
     generate_log: BoolProperty(name="Generate log file", default=False)
+    log_level: EnumProperty(
+        name="Log level",
+        items=[
+            ("warning", "Warning", '', 1),
+            ("info", "Info", '', 2),
+            ("debug", "Debug", '', 3),
+        ],
+        default="info")
+
+    profile_export: BoolProperty(name="Write profile", default=False)
+    profile_cprofile: BoolProperty(name="Write cProfile dump", default=False)
+
+    texture_cache_dir: StringProperty(
+        name="Texture cache",
+        description="Directory to keep converted textures in, "
+                    "leave empty to disable the cache",
+        default='',
+        subtype='DIR_PATH')
+    texture_cache_size: IntProperty(name="Texture cache size (MB)",
+                                    default=64, min=1)
 
     imd_export: BoolProperty(name="Export .imd", default=True)
     imd_magnification: FloatProperty(name="Magnification",
@@ -141,6 +164,10 @@ class ExportNitro(bpy.types.Operator, ExportHelper):
                                      precision=4)
     imd_use_primitive_strip: BoolProperty(name="Use primitive strip",
                                           default=True)
+    imd_reorder_primitives: BoolProperty(name="Reorder primitives",
+                                         default=False)
+    imd_mtx_list_size: IntProperty(name="Matrices per mtx_prim",
+                                   default=31, min=4, max=31)
     imd_compress_nodes: EnumProperty(
         name="Compress nodes",
         items=[
@@ -196,6 +223,12 @@ class ExportNitro(bpy.types.Operator, ExportHelper):
         operator = sfile.active_operator
         layout.prop(operator, 'pretty_print')
         layout.prop(operator, 'generate_log')
+        layout.prop(operator, 'log_level')
+        layout.prop(operator, 'profile_export')
+        if operator.profile_export:
+            layout.prop(operator, 'profile_cprofile')
+        layout.prop(operator, 'texture_cache_dir')
+        layout.prop(operator, 'texture_cache_size')
 
 
 def menu_func_export(self, context):
@@ -0,0 +1,202 @@
+"""
+Exports many .blend files without the user interface, with several Blender
+processes at once.
+
+    blender -b -P batch_export.py -- manifest.json --jobs 4
+
+The manifest is a JSON file with settings for all files and a list of
+files, each with optional settings of its own. Settings are the
+properties of the export operator. Paths are relative to the manifest.
+
+    {
+        "settings": {"imd_compress_nodes": "cull"},
+        "files": [
+            {"blend": "a.blend", "output": "out/a.imd"},
+            {"blend": "b.blend", "settings": {"ica_export": true}}
+        ]
+    }
+
+Every file is exported by a Blender process that runs this script in
+worker mode. A summary is printed and optionally written as JSON. The exit
+code is 1 when any export failed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import subprocess
+import concurrent.futures
+
+
+OUTPUT_EXTENSIONS = ['imd', 'ita', 'ica', 'itp']
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='blender -b -P batch_export.py --',
+        description='Exports .blend files to Nitro intermediate files.')
+    parser.add_argument('manifest', nargs='?',
+                        help='JSON file with the files to export')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='number of Blender processes to run at once')
+    parser.add_argument('--blender',
+                        help='path of the Blender executable, by default '
+                             'the one running this script')
+    parser.add_argument('--summary', help='write the summary to this file')
+    parser.add_argument('--worker', action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    parser.add_argument('--settings', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if not args.worker and args.manifest is None:
+        parser.error('the manifest is required')
+    return args
+
+
+def read_manifest(path):
+    """
+    Returns a list of jobs with the blend file, output path and settings.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for entry in manifest['files']:
+        blend = os.path.join(base, entry['blend'])
+        output = entry.get('output', os.path.splitext(entry['blend'])[0])
+        settings = dict(manifest.get('settings', {}))
+        settings.update(entry.get('settings', {}))
+        jobs.append({
+            'blend': blend,
+            'output': os.path.join(base, output),
+            'settings': settings,
+        })
+    return jobs
+
+
+def get_output_stats(output):
+    """
+    Returns the stat of every file that exists for output, by extension.
+    """
+    stem = os.path.splitext(output)[0]
+    stats = {}
+    for extension in OUTPUT_EXTENSIONS:
+        path = stem + '.' + extension
+        if os.path.exists(path):
+            stats[extension] = os.stat(path)
+    return stats
+
+
+def get_output_sizes(output, old_stats):
+    """
+    Returns the size of every file written for output, by extension. Files
+    that are the same as in old_stats, from before the export, are left
+    out. Exported files replace the old file, so they have a new inode.
+    """
+    sizes = {}
+    for extension, stat in get_output_stats(output).items():
+        old = old_stats.get(extension)
+        if old is None or (old.st_ino, old.st_mtime_ns) != \
+                (stat.st_ino, stat.st_mtime_ns):
+            sizes[extension] = stat.st_size
+    return sizes
+
+
+def run_job(blender, job):
+    """
+    Exports one file in a new Blender process and returns its result.
+    """
+    command = [
+        blender, '-b', job['blend'],
+        '--python-exit-code', '1',
+        '-P', os.path.abspath(__file__),
+        '--',
+        '--worker',
+        '--output', job['output'],
+        '--settings', json.dumps(job['settings']),
+    ]
+    old_stats = get_output_stats(job['output'])
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT,
+                                 universal_newlines=True)
+        success = process.returncode == 0
+        # The end of the output usually has the error.
+        error = '\n'.join(process.stdout.splitlines()[-20:])
+    except (OSError, subprocess.SubprocessError) as e:
+        success = False
+        error = f"Could not run {blender!r}: {e}"
+    result = {
+        'blend': job['blend'],
+        'output': job['output'],
+        'success': success,
+        'seconds': round(time.perf_counter() - start, 3),
+        'sizes': get_output_sizes(job['output'], old_stats),
+    }
+    if not success:
+        result['error'] = error
+    return result
+
+
+def run_batch(args):
+    blender = args.blender
+    if blender is None:
+        import bpy
+        blender = bpy.app.binary_path
+    jobs = read_manifest(args.manifest)
+
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        results = list(executor.map(lambda job: run_job(blender, job), jobs))
+
+    for result in results:
+        status = 'ok' if result['success'] else 'FAILED'
+        sizes = ' '.join([f'{ext}={size}'
+                          for ext, size in result['sizes'].items()])
+        print(f"{status:6} {result['seconds']:8.2f}s {result['blend']} "
+              f"{sizes}")
+        if not result['success']:
+            print(result['error'])
+    failed = len([r for r in results if not r['success']])
+    print(f"Exported {len(results) - failed} of {len(results)} files, "
+          f"{failed} failed.")
+
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(results, f, indent=4)
+    return 1 if failed else 0
+
+
+def run_worker(args):
+    import bpy
+
+    # The add-on is the package this script is in. Register it unless it
+    # is enabled already.
+    path = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(path))
+    addon = importlib.import_module(os.path.basename(path))
+    if not hasattr(bpy.types, 'EXPORT_OT_nitro'):
+        addon.register()
+
+    settings = json.loads(args.settings)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    result = bpy.ops.export.nitro(filepath=args.output, **settings)
+    if result != {'FINISHED'}:
+        raise Exception(f"Export of {bpy.data.filepath} failed: {result}")
+    return 0
+
+
+def main():
+    # Blender passes the arguments of the script after '--'.
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else \
+        sys.argv[1:]
+    args = parse_args(argv)
+    if args.worker:
+        return run_worker(args)
+    return run_batch(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
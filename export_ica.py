@@ -259,8 +259,8 @@ class NitroBCA():
         return self.animations[-1]
 
 
-def generate_anm_info(ica, info, model):
-    node_anm_info = ET.SubElement(ica, 'node_anm_info')
+def generate_anm_info(writer, info, model):
+    node_anm_info = ET.Element('node_anm_info')
     node_anm_info.set('frame_size', str(info.frame_size))
     node_anm_info.set('scaling_rule', 'standard')
     node_anm_info.set('magnify', str(settings['imd_magnification']))
@@ -278,24 +278,27 @@ def generate_anm_info(ica, info, model):
     node_anm_info.set('tolerance_rotate', rotate_tolerance)
     translate_tolerance = '{:.6f}'.format(settings['ica_translate_tolerance'])
     node_anm_info.set('tolerance_translate', translate_tolerance)
+    writer.write(node_anm_info)
 
 
-def generate_data(ica, bca_data: NitroBCAData):
-    node_data = ET.SubElement(ica, bca_data.name)
+def generate_data(writer, bca_data: NitroBCAData):
+    node_data = ET.Element(bca_data.name)
     node_data.set('size', str(len(bca_data.data)))
     data_string = ' '.join(['{:.6f}'.format(x) for x in bca_data.data])
     node_data.text = data_string
+    writer.write(node_data)
 
 
-def generate_animations(ica, animations):
-    node_anm_array = ET.SubElement(ica, 'node_anm_array')
-    node_anm_array.set('size', str(len(animations)))
+def generate_animations(writer, animations):
+    writer.start('node_anm_array', {'size': str(len(animations))})
     for animation in animations:
-        node_anm = ET.SubElement(node_anm_array, 'node_anm')
+        node_anm = ET.Element('node_anm')
         node_anm.set('index', str(animation.index))
 
         for key, reference in animation.references.items():
             generate_reference(node_anm, key, reference)
+        writer.write(node_anm)
+    writer.end()
 
 
 def generate_reference(ica, name, reference):
@@ -305,15 +308,18 @@ def generate_reference(ica, name, reference):
     ref.set('data_head', str(reference.data_head))
 
 
-def generate_body(ica, model, export_settings):
+def collect(model, export_settings):
     global settings
     settings = export_settings
 
     bca = NitroBCA(model)
     bca.collect()
+    return bca
 
-    generate_anm_info(ica, bca.info, model)
-    generate_data(ica, bca.scale_data)
-    generate_data(ica, bca.rotate_data)
-    generate_data(ica, bca.translate_data)
-    generate_animations(ica, bca.animations)
+
+def generate_body(writer, bca, model):
+    generate_anm_info(writer, bca.info, model)
+    generate_data(writer, bca.scale_data)
+    generate_data(writer, bca.rotate_data)
+    generate_data(writer, bca.translate_data)
+    generate_animations(writer, bca.animations)
@@ -10,8 +10,8 @@ from .util import VecFx32
 settings = None
 
 
-def generate_model_info(imd, model):
-    model_info = ET.SubElement(imd, 'model_info')
+def generate_model_info(writer, model):
+    model_info = ET.Element('model_info')
     model_info.set('pos_scale', str(model.info.pos_scale))
     model_info.set('scaling_rule', 'standard')
     model_info.set('vertex_style', 'direct')
@@ -29,12 +29,13 @@ def generate_model_info(imd, model):
     model_info.set('force_full_weight', 'on')
     strip = 'on' if settings['imd_use_primitive_strip'] else 'off'
     model_info.set('use_primitive_strip', strip)
+    writer.write(model_info)
 
 
-def generate_box_test(imd, model):
+def generate_box_test(writer, model):
     # Set Pos Scale
     pos_scale = model.box_test.pos_scale
-    box_test = ET.SubElement(imd, 'box_test')
+    box_test = ET.Element('box_test')
     box_test.set('pos_scale', str(pos_scale))
     # Set Position
     xyz = model.box_test.xyz
@@ -46,15 +47,15 @@ def generate_box_test(imd, model):
     scaled_whd = (VecFx32().from_vector(whd) >> pos_scale).to_vector()
     floats = [str(v) for v in scaled_whd]
     box_test.set('whd', ' '.join(floats))
+    writer.write(box_test)
 
 
-def generate_textures(imd, model):
+def generate_textures(writer, model):
     if len(model.textures) == 0:
         return
-    tex_image_array = ET.SubElement(imd, 'tex_image_array')
-    tex_image_array.set('size', str(len(model.textures)))
+    writer.start('tex_image_array', {'size': str(len(model.textures))})
     for tex in model.textures:
-        tex_image = ET.SubElement(tex_image_array, 'tex_image')
+        tex_image = ET.Element('tex_image')
         tex_image.set('index', str(tex.index))
         tex_image.set('name', tex.name)
         tex_image.set('width', str(tex.width))
@@ -74,26 +75,28 @@ def generate_textures(imd, model):
             tex4x4_palette_idx = ET.SubElement(tex_image, 'tex4x4_palette_idx')
             tex4x4_palette_idx.set('size', str(tex.tex4x4_palette_idx_size))
             tex4x4_palette_idx.text = tex.tex4x4_palette_idx_data
+        writer.write(tex_image)
+    writer.end()
 
 
-def generate_palettes(imd, model):
+def generate_palettes(writer, model):
     if len(model.palettes) == 0:
         return
-    tex_palette_array = ET.SubElement(imd, 'tex_palette_array')
-    tex_palette_array.set('size', str(len(model.palettes)))
+    writer.start('tex_palette_array', {'size': str(len(model.palettes))})
     for pal in model.palettes:
-        tex_palette = ET.SubElement(tex_palette_array, 'tex_palette')
+        tex_palette = ET.Element('tex_palette')
         tex_palette.set('index', str(pal.index))
         tex_palette.set('name', pal.name)
         tex_palette.set('color_size', str(pal.size))
         tex_palette.text = pal.data
+        writer.write(tex_palette)
+    writer.end()
 
 
-def generate_materials(imd, model):
-    material_array = ET.SubElement(imd, 'material_array')
-    material_array.set('size', str(len(model.materials)))
+def generate_materials(writer, model):
+    writer.start('material_array', {'size': str(len(model.materials))})
     for mat in model.materials:
-        material = ET.SubElement(material_array, 'material')
+        material = ET.Element('material')
         material.set('index', str(mat.index))
         material.set('name', mat.name)
         material.set('light0', mat.light0)
@@ -128,23 +131,25 @@ def generate_materials(imd, model):
             if mat.tex_gen_mode == 'nrm' or mat.tex_gen_mode == 'pos':
                 material.set('tex_gen_st_src', mat.tex_gen_st_src)
                 material.set('tex_effect_mtx', mat.tex_effect_mtx)
+        writer.write(material)
+    writer.end()
 
 
-def generate_matrices(imd, model):
-    matrix_array = ET.SubElement(imd, 'matrix_array')
-    matrix_array.set('size', str(len(model.matrices)))
+def generate_matrices(writer, model):
+    writer.start('matrix_array', {'size': str(len(model.matrices))})
     for matrix in model.matrices:
-        matrix_t = ET.SubElement(matrix_array, 'matrix')
+        matrix_t = ET.Element('matrix')
         matrix_t.set('index', str(matrix.index))
         matrix_t.set('mtx_weight', str(matrix.weight))
         matrix_t.set('node_idx', str(matrix.node_idx))
+        writer.write(matrix_t)
+    writer.end()
 
 
-def generate_polygons(imd, model):
-    polygons = ET.SubElement(imd, 'polygon_array')
-    polygons.set('size', str(len(model.polygons)))
+def generate_polygons(writer, model):
+    writer.start('polygon_array', {'size': str(len(model.polygons))})
     for polygon in model.polygons:
-        polygon_t = ET.SubElement(polygons, 'polygon')
+        polygon_t = ET.Element('polygon')
         polygon_t.set('index', str(polygon.index))
         polygon_t.set('name', polygon.name)
         polygon_t.set('mtx_prim_size', str(len(polygon.mtx_prims)))
@@ -155,34 +160,43 @@ def generate_polygons(imd, model):
         polygon_t.set('polygon_size', str(polygon.polygon_size))
         polygon_t.set('triangle_size', str(polygon.triangle_size))
         polygon_t.set('quad_size', str(polygon.quad_size))
+        # Polygons can be large, so they are written one command at a time.
+        writer.start(polygon_t.tag, polygon_t.attrib)
 
         for mtx_prim in polygon.mtx_prims:
-            mtx_prim_t = ET.SubElement(polygon_t, 'mtx_prim')
-            mtx_prim_t.set('index', str(mtx_prim.index))
+            writer.start('mtx_prim', {'index': str(mtx_prim.index)})
 
-            mtx_list_t = ET.SubElement(mtx_prim_t, 'mtx_list')
+            mtx_list_t = ET.Element('mtx_list')
             mtx_list_t.set('size', str(len(mtx_prim.mtx_list)))
             mtx_list_t.text = ' '.join([str(x) for x in mtx_prim.mtx_list])
+            writer.write(mtx_list_t)
 
-            primitive_array = ET.SubElement(mtx_prim_t, 'primitive_array')
-            primitive_array.set('size', str(len(mtx_prim.primitives)))
+            writer.start('primitive_array',
+                         {'size': str(len(mtx_prim.primitives))})
 
             for index, primitive in enumerate(mtx_prim.primitives):
-                primitive_t = ET.SubElement(primitive_array, 'primitive')
-                primitive_t.set('index', str(index))
-                primitive_t.set('type', primitive.type)
-                primitive_t.set('vertex_size', str(primitive.vertex_size))
-                for cmd in primitive.commands:
-                    command = ET.SubElement(primitive_t, cmd.type)
-                    command.set(cmd.tag, cmd.data)
+                writer.start('primitive', {
+                    'index': str(index),
+                    'type': primitive.type,
+                    'vertex_size': str(primitive.vertex_size),
+                })
+                commands = primitive.commands
+                for idx in range(len(commands)):
+                    type_, tag, data = commands.format(idx)
+                    writer.start(type_, {tag: data})
+                    writer.end()
+                writer.end()
+            writer.end()
+            writer.end()
+        writer.end()
+    writer.end()
 
 
-def generate_nodes(imd, model: NitroModel):
-    node_array = ET.SubElement(imd, 'node_array')
-    node_array.set('size', str(len(model.nodes)))
+def generate_nodes(writer, model: NitroModel):
+    writer.start('node_array', {'size': str(len(model.nodes))})
 
     for node in model.nodes:
-        node_t = ET.SubElement(node_array, 'node')
+        node_t = ET.Element('node')
         node_t.set('index', str(node.index))
         node_t.set('name', node.name)
         node_t.set('kind', str(node.kind))
@@ -216,27 +230,30 @@ def generate_nodes(imd, model: NitroModel):
             display_t.set('material', str(display.material))
             display_t.set('polygon', str(display.polygon))
             display_t.set('priority', str(model.materials[display.material].priority_id))
+        writer.write(node_t)
+    writer.end()
 
 
-def generate_output_info(imd, model):
+def generate_output_info(writer, model):
     output = model.output_info
-    output_info = ET.SubElement(imd, 'output_info')
+    output_info = ET.Element('output_info')
     output_info.set('vertex_size', str(output.vertex_size))
     output_info.set('polygon_size', str(output.polygon_size))
     output_info.set('triangle_size', str(output.triangle_size))
     output_info.set('quad_size', str(output.quad_size))
+    writer.write(output_info)
 
 
-def generate_body(imd, model, export_settings):
+def generate_body(writer, model, export_settings):
     global settings
     settings = export_settings
 
-    generate_model_info(imd, model)
-    generate_box_test(imd, model)
-    generate_textures(imd, model)
-    generate_palettes(imd, model)
-    generate_materials(imd, model)
-    generate_matrices(imd, model)
-    generate_polygons(imd, model)
-    generate_nodes(imd, model)
-    generate_output_info(imd, model)
+    generate_model_info(writer, model)
+    generate_box_test(writer, model)
+    generate_textures(writer, model)
+    generate_palettes(writer, model)
+    generate_materials(writer, model)
+    generate_matrices(writer, model)
+    generate_polygons(writer, model)
+    generate_nodes(writer, model)
+    generate_output_info(writer, model)
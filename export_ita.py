@@ -134,8 +134,8 @@ class NitroSRT():
         return self.animations[-1]
 
 
-def generate_srt_info(ita, info):
-    tex_srt_info = ET.SubElement(ita, 'tex_srt_info')
+def generate_srt_info(writer, info):
+    tex_srt_info = ET.Element('tex_srt_info')
     tex_srt_info.set('frame_size', str(info.frame_size))
     tex_srt_info.set('tool_start_frame', '0')
     tex_srt_info.set('tool_end_frame', str(info.frame_size))
@@ -150,25 +150,28 @@ def generate_srt_info(ita, info):
     tex_srt_info.set('tolerance_tex_rotate', rotate_tolerance)
     translate_tolerance = '{:.6f}'.format(settings['ita_translate_tolerance'])
     tex_srt_info.set('tolerance_tex_translate', translate_tolerance)
+    writer.write(tex_srt_info)
 
 
-def generate_data(ita, str_data: NitroSRTData):
-    tex_data = ET.SubElement(ita, str_data.name)
+def generate_data(writer, str_data: NitroSRTData):
+    tex_data = ET.Element(str_data.name)
     tex_data.set('size', str(len(str_data.data)))
     data_string = ' '.join(['{:.6f}'.format(x) for x in str_data.data])
     tex_data.text = data_string
+    writer.write(tex_data)
 
 
-def generate_animations(ita, animations):
-    tex_srt_anm_array = ET.SubElement(ita, 'tex_srt_anm_array')
-    tex_srt_anm_array.set('size', str(len(animations)))
+def generate_animations(writer, animations):
+    writer.start('tex_srt_anm_array', {'size': str(len(animations))})
     for animation in animations:
-        tex_srt_anm = ET.SubElement(tex_srt_anm_array, 'tex_srt_anm')
+        tex_srt_anm = ET.Element('tex_srt_anm')
         tex_srt_anm.set('index', str(animation.index))
         tex_srt_anm.set('material_name', str(animation.material_name))
 
         for key, reference in animation.references.items():
             generate_reference(tex_srt_anm, key, reference)
+        writer.write(tex_srt_anm)
+    writer.end()
 
 
 def generate_reference(ita, name, reference):
@@ -178,15 +181,18 @@ def generate_reference(ita, name, reference):
     ref.set('data_head', str(reference.data_head))
 
 
-def generate_body(ita, export_settings):
+def collect(export_settings):
     global settings
     settings = export_settings
 
     srt = NitroSRT()
     srt.collect()
+    return srt
 
-    generate_srt_info(ita, srt.info)
-    generate_data(ita, srt.scale_data)
-    generate_data(ita, srt.rotate_data)
-    generate_data(ita, srt.translate_data)
-    generate_animations(ita, srt.animations)
+
+def generate_body(writer, srt):
+    generate_srt_info(writer, srt.info)
+    generate_data(writer, srt.scale_data)
+    generate_data(writer, srt.rotate_data)
+    generate_data(writer, srt.translate_data)
+    generate_animations(writer, srt.animations)
@@ -126,18 +126,19 @@ class NitroTXP:
             self.imgPlt.find_palette(texName.palette_name)
 
 
-def generate_txp_info(itp, info):
-    tex_pattern_info = ET.SubElement(itp, 'tex_pattern_info')
+def generate_txp_info(writer, info):
+    tex_pattern_info = ET.Element('tex_pattern_info')
     tex_pattern_info.set('frame_size', str(info.frame_size))
     tex_pattern_info.set('tool_start_frame', '0')
     tex_pattern_info.set('tool_end_frame', str(info.frame_size-1))
     tex_pattern_info.set('compress_material', 'off')
     tex_pattern_info.set('material_size', '1 1')
+    writer.write(tex_pattern_info)
 
 
-def generate_txp_pattern_list_data(itp, img_plt):
+def generate_txp_pattern_list_data(writer, img_plt):
 
-    tex_pattern_LD = ET.SubElement(itp, "tex_pattern_list_data")
+    tex_pattern_LD = ET.Element("tex_pattern_list_data")
     tex_pattern_LD.set('image_size', str(len(img_plt.images)))
     tex_pattern_LD.set('palette_size', str(len(img_plt.palettes)))
 
@@ -150,10 +151,11 @@ def generate_txp_pattern_list_data(itp, img_plt):
         pattern_image = ET.SubElement(tex_pattern_LD, "palette_name")
         pattern_image.set("index", str(pltID))
         pattern_image.set("name", str(img_plt.palettes[pltID]))
+    writer.write(tex_pattern_LD)
 
 
-def generate_txp_pattern_data(itp, data):
-    tex_pattern_data = ET.SubElement(itp, "tex_pattern_data")
+def generate_txp_pattern_data(writer, data):
+    tex_pattern_data = ET.Element("tex_pattern_data")
 
     frame_idx = ET.SubElement(tex_pattern_data, "frame_idx")
     frame_idx.set("size", str(len(data.frame_ids)))
@@ -166,30 +168,34 @@ def generate_txp_pattern_data(itp, data):
     palette_idx = ET.SubElement(tex_pattern_data, "palette_idx")
     palette_idx.set("size", str(len(data.palette_ids)))
     palette_idx.text = ' '.join([str(x) for x in data.palette_ids])
+    writer.write(tex_pattern_data)
 
 
-def generate_txp_anm_array(itp, anm):
-    tex_pattern_anm_array = ET.SubElement(itp, "tex_pattern_anm_array")
-    tex_pattern_anm_array.set("size", str(len(anm)))
+def generate_txp_anm_array(writer, anm):
+    writer.start("tex_pattern_anm_array", {"size": str(len(anm))})
 
     for keyID in range(len(anm.keys())):
         name = list(anm.keys())[keyID]
-        tex_pattern_anm = ET.SubElement(
-            tex_pattern_anm_array, "tex_pattern_anm")
+        tex_pattern_anm = ET.Element("tex_pattern_anm")
         tex_pattern_anm.set("index", str(keyID))
         tex_pattern_anm.set("material_name", name)
         tex_pattern_anm.set("data_size", str(anm[name][0]))
         tex_pattern_anm.set("data_head", str(anm[name][1]))
+        writer.write(tex_pattern_anm)
+    writer.end()
 
 
-def generate_body(itp, model: NitroModel, export_settings):
+def collect(model: NitroModel, export_settings):
     global settings
     settings = export_settings
 
     txp = NitroTXP()
     txp.collect(model)
+    return txp
 
-    generate_txp_info(itp, txp.info)
-    generate_txp_pattern_list_data(itp, txp.imgPlt)
-    generate_txp_pattern_data(itp, txp.data)
-    generate_txp_anm_array(itp, txp.pattern_anm)
+
+def generate_body(writer, txp):
+    generate_txp_info(writer, txp.info)
+    generate_txp_pattern_list_data(writer, txp.imgPlt)
+    generate_txp_pattern_data(writer, txp.data)
+    generate_txp_anm_array(writer, txp.pattern_anm)
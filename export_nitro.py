@@ -1,14 +1,15 @@
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 from . import local_logger as logger
+from . import profiler
+from .xml_writer import XMLWriter
 from .nns_model import NitroModel
 import os
+import time
 from .version import get_version_str
 
 
-def generate_header(imd, data_name):
-    imd.set('version', '1.6.0')
-    head = ET.SubElement(imd, 'head')
+def generate_header(writer, data_name):
+    head = ET.Element('head')
 
     title = ET.SubElement(head, 'title')
     title.text = data_name + ' for NINTENDO NITRO-System'
@@ -16,104 +17,106 @@ def generate_header(imd, data_name):
     generator = ET.SubElement(head, 'generator')
     generator.set('name', 'Nitro plugin for Blender 2.8')
     generator.set('version', get_version_str())
-
-
-def generate_imd(settings, model):
+    writer.write(head)
+
+
+def generate_file(settings, extension, data_name, generate_body):
+    """
+    Writes the file with the given extension, generate_body is called with
+    the writer to write the elements of the body.
+    """
+    start = time.perf_counter()
+    path = settings['filepath'] + '.' + extension
+    with profiler.stage('write .' + extension), \
+            XMLWriter(path, settings['pretty_print']) as writer:
+        writer.start(extension, {'version': '1.6.0'})
+        generate_header(writer, data_name)
+        writer.start('body')
+        generate_body(writer)
+        writer.end()
+        writer.end()
+    profiler.count('write .' + extension, writer.element_count)
+    logger.log(f"Wrote .{extension} in {time.perf_counter() - start:.2f}s.")
+
+
+# The collect functions below read the data of a file from Blender and
+# return a function that writes the body of the file. Only the collect
+# functions use Blender data, the writing doesn't.
+def collect_imd(settings, model):
     from . import export_imd
 
-    imd = ET.Element('imd')
-    generate_header(imd, 'Model Data')
-    body = ET.SubElement(imd, 'body')
-    export_imd.generate_body(body, model, settings)
-
-    output = ""
-    if settings['pretty_print']:
-        output = minidom.parseString(ET.tostring(imd, encoding='unicode'))
-        output = output.toprettyxml(indent='   ')
-    else:
-        output = ET.tostring(imd, encoding='unicode')
+    return lambda writer: export_imd.generate_body(writer, model, settings)
 
-    with open(settings['filepath'] + '.imd', 'w') as f:
-        f.write(output)
 
-
-def generate_ita(settings):
+def collect_ita(settings, model):
     from . import export_ita
 
-    ita = ET.Element('ita')
-    generate_header(ita, 'Texture SRT Animation Data')
-    body = ET.SubElement(ita, 'body')
-    export_ita.generate_body(body, settings)
-
-    output = ""
-    if settings['pretty_print']:
-        output = minidom.parseString(ET.tostring(ita, encoding='unicode'))
-        output = output.toprettyxml(indent='   ')
-    else:
-        output = ET.tostring(ita, encoding='unicode')
+    srt = export_ita.collect(settings)
+    return lambda writer: export_ita.generate_body(writer, srt)
 
-    with open(settings['filepath'] + '.ita', 'w') as f:
-        f.write(output)
 
-
-def generate_ica(settings, model):
+def collect_ica(settings, model):
     from . import export_ica
 
-    ica = ET.Element('ica')
-    generate_header(ica, 'Character Animation Data')
-    body = ET.SubElement(ica, 'body')
-    export_ica.generate_body(body, model, settings)
-
-    output = ""
-    if settings['pretty_print']:
-        output = minidom.parseString(ET.tostring(ica, encoding='unicode'))
-        output = output.toprettyxml(indent='   ')
-    else:
-        output = ET.tostring(ica, encoding='unicode')
+    bca = export_ica.collect(model, settings)
+    return lambda writer: export_ica.generate_body(writer, bca, model)
 
-    with open(settings['filepath'] + '.ica', 'w') as f:
-        f.write(output)
 
-
-def generate_itp(settings, model):
+def collect_itp(settings, model):
     from . import export_itp
 
-    itp = ET.Element('itp')
-    generate_header(itp, 'Texture Pattern Animation Data')
-    body = ET.SubElement(itp, 'body')
-    export_itp.generate_body(body, model, settings)
+    txp = export_itp.collect(model, settings)
+    return lambda writer: export_itp.generate_body(writer, txp)
 
-    output = ""
-    if settings['pretty_print']:
-        output = minidom.parseString(ET.tostring(itp, encoding='unicode'))
-        output = output.toprettyxml(indent='   ')
-    else:
-        output = ET.tostring(itp, encoding='unicode')
 
-    with open(settings['filepath'] + '.itp', 'w') as f:
-        f.write(output)
+# The files in the order they are collected. The imd is last because the
+# other files may have changed things.
+FILES = [
+    ('ita', 'Texture SRT Animation Data', collect_ita),
+    ('ica', 'Character Animation Data', collect_ica),
+    ('itp', 'Texture Pattern Animation Data', collect_itp),
+    ('imd', 'Model Data', collect_imd),
+]
 
 
 def save(context, settings):
 
     settings['filepath'] = os.path.splitext(settings['filepath'])[0]
 
-    logger.create_log(settings['filepath'], settings['generate_log'])
+    logger.create_log(settings['filepath'], settings['generate_log'],
+                      settings['log_level'])
+    profiler.start_profile(settings['profile_export'],
+                           settings['profile_cprofile'])
+    try:
+        export(settings)
+    finally:
+        profiler.stop_profile(settings['filepath'])
+        logger.close_log()
+
 
+def export(settings):
     model = None
 
     if (settings['imd_export']
        or settings['ica_export']
        or settings['itp_export']):
-        model = NitroModel(settings)
-        model.collect()
-
-    if settings['ita_export']:
-        generate_ita(settings)
-    if settings['ica_export']:
-        generate_ica(settings, model)
-    if settings['itp_export']:
-        generate_itp(settings, model)
-    # Generate the imd as last because the other files may have changed things.
-    if settings['imd_export']:
-        generate_imd(settings, model)
+        start = time.perf_counter()
+        with profiler.stage('collect model'):
+            model = NitroModel(settings)
+            model.collect()
+        logger.log(f"Collected model in {time.perf_counter() - start:.2f}s.")
+
+    # Every file is written right after it is collected, so only the data
+    # of one file is kept at a time. Files are not written in parallel:
+    # threads don't overlap because writing holds the GIL, and worker
+    # processes can't import the writers without bpy or receive the
+    # collected data, which holds mathutils objects that can't be pickled.
+    for extension, data_name, collect in FILES:
+        if not settings[extension + '_export']:
+            continue
+        start = time.perf_counter()
+        with profiler.stage('collect .' + extension):
+            generate_body = collect(settings, model)
+        logger.log(f"Collected .{extension} in "
+                   f"{time.perf_counter() - start:.2f}s.")
+        generate_file(settings, extension, data_name, generate_body)
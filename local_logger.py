@@ -1,22 +1,94 @@
-_logger_filepath = ''
+import threading
 
 
-_can_log = False
+DEBUG = 10
+INFO = 20
+WARNING = 30
 
+LEVELS = {
+    'debug': DEBUG,
+    'info': INFO,
+    'warning': WARNING,
+}
 
-def create_log(filepath, can_log):
-    global _logger_filepath, _can_log
-    _can_log = can_log
+
+_log_file = None
+
+
+_level = INFO
+
+
+# Number of times every repeated message was logged.
+_repeats = {}
+
+
+_lock = threading.Lock()
+
+
+def create_log(filepath, can_log, level='info'):
+    """
+    Starts logging to the console, and to filepath.log if can_log is set.
+    Messages below level are dropped. The file is kept open until
+    close_log is called.
+    """
+    global _log_file, _level
+    close_log()
+    _level = LEVELS[level]
     if can_log:
-        _logger_filepath = filepath + '.log'
-        f = open(_logger_filepath, 'w+')
-        f.close()
-
-
-def log(text):
-    global _logger_filepath, _can_log
-    print(text)
-    if _can_log:
-        f = open(_logger_filepath, 'a+')
-        f.write(text + '\n')
-        f.close()
+        _log_file = open(filepath + '.log', 'w', buffering=1 << 16)
+
+
+def close_log():
+    """
+    Logs how often repeated messages were logged and closes the log file.
+    """
+    global _log_file
+    with _lock:
+        repeats = [(text, level, count)
+                   for (text, level), count in _repeats.items()
+                   if count > 1]
+        _repeats.clear()
+    for text, level, count in repeats:
+        log(f"{text} (x{count})", level)
+    if _log_file is not None:
+        _log_file.close()
+        _log_file = None
+
+
+def log(text, level=INFO):
+    if level < _level:
+        return
+    with _lock:
+        print(text)
+        if _log_file is not None:
+            _log_file.write(text + '\n')
+
+
+def debug(text, *args):
+    """
+    Logs text at the debug level. Arguments are formatted into text with
+    the % operator only when debug messages are logged, so messages in
+    loops cost nothing otherwise.
+    """
+    if DEBUG < _level:
+        return
+    log(text % args if args else text, DEBUG)
+
+
+def warning(text):
+    log(text, WARNING)
+
+
+def log_repeated(text, level=INFO):
+    """
+    Logs text the first time, later calls with the same text are only
+    counted and the total is logged by close_log.
+    """
+    if level < _level:
+        return
+    key = (text, level)
+    with _lock:
+        count = _repeats.get(key, 0)
+        _repeats[key] = count + 1
+    if not count:
+        log(text, level)
@@ -1,6 +1,10 @@
 import os
+import concurrent.futures
 import math
 import decimal
+import heapq
+from array import array
+import numpy as np
 from mathutils import Matrix
 import bpy
 from bpy_extras import node_shader_utils
@@ -8,7 +12,9 @@ from bpy_extras.io_utils import axis_conversion
 from .util import *
 from .primitive import *
 from . import local_logger as logger
+from . import profiler
 from . import nns_tga
+from .texture_cache import TextureCache
 
 
 class NitroModelInfo():
@@ -16,8 +22,13 @@ class NitroModelInfo():
         self.pos_scale = 0
         self.max_coord = 0
 
-    def add(self, vertex):
-        max_coord = max(abs(vertex.x), abs(vertex.y), abs(vertex.z))
+    def add(self, positions):
+        """
+        Adds an array of positions of shape (n, 3).
+        """
+        if not len(positions):
+            return
+        max_coord = float(np.abs(positions).max())
         if max_coord > self.max_coord:
             self.max_coord = max_coord
 
@@ -37,35 +48,89 @@ class NitroModelBoxTest():
         self.pos_scale = calculate_pos_scale(max_coord)
 
 
+@profiler.stage('read_texture')
+def read_texture(path):
+    """
+    Reads the Nitro TGA at path and returns its converted data.
+    """
+    with nns_tga.read_nitro_tga(path) as tga:
+        tex_format = tga['nitro_data']['tex_format']
+        data = {
+            'format': tex_format,
+            'width': tga['header']['image_width'],
+            'height': tga['header']['image_heigth'],
+            'color_0_transp': tga['nitro_data']['color_0_transp'],
+            'bitmap_data': nns_tga.get_bitmap_data(tga),
+            'bitmap_size': nns_tga.get_bitmap_size(tga),
+            'pltt_idx_data': None,
+            'pltt_idx_size': None,
+            'palette_name': None,
+            'palette_data': None,
+            'palette_size': None,
+        }
+        if tex_format == 'tex4x4':
+            data['pltt_idx_data'] = nns_tga.get_pltt_idx_data(tga)
+            data['pltt_idx_size'] = nns_tga.get_pltt_idx_size(tga)
+        if tex_format != 'direct':
+            data['palette_name'] = tga['nitro_data']['palette_name']
+            data['palette_data'] = nns_tga.get_palette_data(tga)
+            data['palette_size'] = nns_tga.get_palette_size(tga)
+    return data
+
+
+def get_texture_paths(material):
+    """
+    Returns the path of the image of material, or None if it has no Nitro
+    TGA image, and the paths of its texture animation frames.
+    """
+    image_path = None
+    frame_paths = []
+    if material.is_nns:
+        if material.nns_image is not None and "tx" in material.nns_mat_type:
+            path = os.path.realpath(
+                bpy.path.abspath(material.nns_image.filepath))
+            if os.path.splitext(path)[1] == '.tga':
+                image_path = path
+            for i in material.nns_texframe_reference:
+                frame_paths.append(os.path.realpath(
+                    bpy.path.abspath(i.image.filepath)))
+    else:
+        wrap = node_shader_utils.PrincipledBSDFWrapper(material)
+        tex_wrap = getattr(wrap, 'base_color_texture', None)
+        if tex_wrap is not None and tex_wrap.image is not None:
+            path = os.path.realpath(bpy.path.abspath(
+                tex_wrap.image.filepath, library=tex_wrap.image.library))
+            if os.path.splitext(path)[1] == '.tga':
+                image_path = path
+    return image_path, frame_paths
+
+
 class NitroModelTexture():
-    def __init__(self, model, path, index):
+    def __init__(self, model, path, index, data):
         self.path = path
         self.index = index
         self.name = str(os.path.splitext(os.path.basename(path))[0])[0:15]
 
-        # Load Nitro TGA Data from path
-        tga = nns_tga.read_nitro_tga(path)
-
         # Set TexImage properties
-        self.format = tga['nitro_data']['tex_format']
-        self.width = tga['header']['image_width']
-        self.height = tga['header']['image_heigth']
-        self.original_width = tga['header']['image_width']
-        self.original_height = tga['header']['image_heigth']
+        self.format = data['format']
+        self.width = data['width']
+        self.height = data['height']
+        self.original_width = data['width']
+        self.original_height = data['height']
 
         # Color 0 Mode
-        transp = tga['nitro_data']['color_0_transp']
+        transp = data['color_0_transp']
         if self.format in ('palette4', 'palette16', 'palette256'):
             self.color0_mode = 'transparency' if transp else 'color'
 
         # Get Bitmap Data
-        self.bitmap_data = nns_tga.get_bitmap_data(tga)
-        self.bitmap_size = nns_tga.get_bitmap_size(tga)
+        self.bitmap_data = data['bitmap_data']
+        self.bitmap_size = data['bitmap_size']
 
         # Get Tex4x4 Palette Index Data
         if self.format == 'tex4x4':
-            self.tex4x4_palette_idx_data = nns_tga.get_pltt_idx_data(tga)
-            self.tex4x4_palette_idx_size = nns_tga.get_pltt_idx_size(tga)
+            self.tex4x4_palette_idx_data = data['pltt_idx_data']
+            self.tex4x4_palette_idx_size = data['pltt_idx_size']
 
         # Store the palette index that model.add_palette returns in here or
         # leave it -1.
@@ -73,10 +138,10 @@ class NitroModelTexture():
 
         # Get Palette Data
         if self.format != 'direct':
-            self.palette_name = tga['nitro_data']['palette_name'][0:15]
-            plt_data = nns_tga.get_palette_data(tga)
-            plt_size = nns_tga.get_palette_size(tga)
-            palette = model.add_palette(self.palette_name, plt_data, plt_size)
+            self.palette_name = data['palette_name'][0:15]
+            palette = model.add_palette(self.palette_name,
+                                        data['palette_data'],
+                                        data['palette_size'])
             self.palette_idx = palette.index
 
 
@@ -150,21 +215,6 @@ class NitroModelMaterial():
             self.emission = ' '.join(
                 [str(int(round(lin2s(x) * 31)))
                  for x in material.nns_emission])
-            if material.nns_image is not None \
-                    and "tx" in material.nns_mat_type:
-                filepath = material.nns_image.filepath
-                path = os.path.realpath(bpy.path.abspath(filepath))
-                _, extension = os.path.splitext(path)
-                if extension == '.tga':
-                    texture = model.find_texture(path)
-                    self.image_idx = texture.index
-                    self.palette_idx = texture.palette_idx
-
-                for i in material.nns_texframe_reference:
-
-                    fPath=os.path.realpath(bpy.path.abspath(i.image.filepath))
-                    model.find_texture(fPath)
-
         else:
             # For now let's use PrincipledBSDF to get the color and image.
             wrap = node_shader_utils.PrincipledBSDFWrapper(material)
@@ -179,15 +229,13 @@ class NitroModelMaterial():
             self.ambient = '31 31 31'
             self.emission = '0 0 0'
 
-            tex_wrap = getattr(wrap, 'base_color_texture', None)
-            if tex_wrap is not None and tex_wrap.image is not None:
-                path = os.path.realpath(bpy.path.abspath(
-                    tex_wrap.image.filepath, library=tex_wrap.image.library))
-                _, extension = os.path.splitext(path)
-                if extension == '.tga':
-                    texture = model.find_texture(path)
-                    self.image_idx = texture.index
-                    self.palette_idx = texture.palette_idx
+        image_path, frame_paths = get_texture_paths(material)
+        if image_path is not None:
+            texture = model.find_texture(image_path)
+            self.image_idx = texture.index
+            self.palette_idx = texture.palette_idx
+        for path in frame_paths:
+            model.find_texture(path)
 
 
 class NitroModelMatrix():
@@ -198,11 +246,130 @@ class NitroModelMatrix():
         self.transform = transform
 
 
-class NitroModelCommand():
-    def __init__(self, type_, tag, data):
-        self.type = type_
-        self.tag = tag
-        self.data = data
+# Display list command opcodes.
+CMD_MTX = 0
+CMD_TEX = 1
+CMD_CLR = 2
+CMD_NRM = 3
+CMD_POS_XYZ = 4
+CMD_POS_S = 5
+CMD_POS_DIFF = 6
+CMD_POS_YZ = 7
+CMD_POS_XZ = 8
+CMD_POS_XY = 9
+
+# Commands that set state which is kept until it is set again.
+STATE_COMMANDS = (CMD_MTX, CMD_TEX, CMD_CLR, CMD_NRM)
+
+# Size in bytes of the parameters of every opcode on the DS. pos_xyz is
+# VTX_16 with two parameter words, the others take one word.
+COMMAND_PARAM_SIZES = [4, 4, 4, 4, 8, 4, 4, 4, 4, 4]
+
+# Every primitive starts with a BEGIN_VTXS command with one parameter.
+BEGIN_VTXS_PARAM_SIZE = 4
+
+
+def get_command_size(opcode):
+    """
+    Size in bytes of a command in a packed display list, its command id
+    takes one byte.
+    """
+    return 1 + COMMAND_PARAM_SIZES[opcode]
+
+
+def get_packed_size(command_count, param_size):
+    """
+    Size in bytes of a packed display list. Command ids are packed four to
+    a word, followed by the parameters of the commands.
+    """
+    return (command_count + 3) // 4 * 4 + param_size
+
+# Element and attribute names of every opcode.
+COMMAND_TAGS = [
+    ('mtx', 'idx'),
+    ('tex', 'st'),
+    ('clr', 'rgb'),
+    ('nrm', 'xyz'),
+    ('pos_xyz', 'xyz'),
+    ('pos_s', 'xyz'),
+    ('pos_diff', 'xyz'),
+    ('pos_yz', 'yz'),
+    ('pos_xz', 'xz'),
+    ('pos_xy', 'xy'),
+]
+
+
+class NitroModelCommandBuffer():
+    """
+    The display list commands of a primitive, stored as opcodes with a
+    fixed number of integer operands. Positions are in FX32 and normals
+    in FX10. Commands are only formatted to text when they are written.
+    """
+    OPERAND_COUNT = 4
+
+    def __init__(self):
+        self.opcodes = array('B')
+        self.operands = array('q')
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __iter__(self):
+        for idx in range(len(self.opcodes)):
+            yield self.get(idx)
+
+    def make_operands(self, operands):
+        padding = [0] * (self.OPERAND_COUNT - len(operands))
+        return array('q', list(operands) + padding)
+
+    def add(self, opcode, *operands):
+        self.opcodes.append(opcode)
+        self.operands.extend(self.make_operands(operands))
+
+    def insert(self, position, opcode, *operands):
+        self.opcodes.insert(position, opcode)
+        i = position * self.OPERAND_COUNT
+        self.operands[i:i] = self.make_operands(operands)
+
+    def get(self, idx):
+        i = idx * self.OPERAND_COUNT
+        return self.opcodes[idx], self.operands[i:i + self.OPERAND_COUNT]
+
+    def get_param_size(self):
+        return sum(COMMAND_PARAM_SIZES[opcode] for opcode in self.opcodes)
+
+    def format(self, idx):
+        """
+        Returns the element name, attribute name and attribute value of
+        a command.
+        """
+        opcode, operands = self.get(idx)
+        type_, tag = COMMAND_TAGS[opcode]
+        if opcode == CMD_MTX:
+            data = str(operands[0])
+        elif opcode == CMD_TEX:
+            # Texture coordinates in FX32 and the texture size.
+            width, height = operands[2], operands[3]
+            s = fx32_to_float(operands[0]) * width
+            t = fx32_to_float(operands[1]) * -height + height
+            data = f'{s} {t}'
+        elif opcode == CMD_CLR:
+            data = f'{operands[0]} {operands[1]} {operands[2]}'
+        elif opcode == CMD_NRM:
+            x, y, z = [fx10_to_float(v) for v in operands[0:3]]
+            data = f'{x} {y} {z}'
+        else:
+            if opcode == CMD_POS_YZ:
+                values = [operands[1], operands[2]]
+            elif opcode == CMD_POS_XZ:
+                values = [operands[0], operands[2]]
+            elif opcode == CMD_POS_XY:
+                values = [operands[0], operands[1]]
+            else:
+                values = operands[0:3]
+            floats = [str(round(fx32_to_float(v), 6)) for v in values]
+            data = ' '.join(floats)
+        return type_, tag, data
 
 
 class NitroModelPrimitive():
@@ -211,8 +378,8 @@ class NitroModelPrimitive():
         self.vertex_size = 0
         self.triangle_size = 0
         self.quad_size = 0
-        self.commands = []
-        self._previous_vecfx32 = None
+        self.commands = NitroModelCommandBuffer()
+        self._previous_pos = None
         self._previous_mtx = -1
         self._previous_nrm = None
         self._previous_tex = None
@@ -222,47 +389,123 @@ class NitroModelPrimitive():
         self.sort_key = 0
 
     def is_empty(self):
-        return self._previous_vecfx32 is None
-
-    def add_command(self, type_: str, tag: str, data: str):
-        self.commands.append(NitroModelCommand(type_, tag, data))
+        return self._previous_pos is None
 
     def insert_mtx(self, position, idx: int):
-        self.commands.insert(
-            position, NitroModelCommand('mtx', 'idx', str(idx)))
+        self.commands.insert(position, CMD_MTX, idx)
 
     def add_mtx(self, idx: int):
-        self.add_command('mtx', 'idx', str(idx))
-
-    def add_pos_xyz(self, vec: Vector):
-        floats = [str(round(v, 6)) for v in vec]
-        self.add_command('pos_xyz', 'xyz', ' '.join(floats))
-        self.vertex_size += 1
+        self.commands.add(CMD_MTX, idx)
 
-    def add_pos_s(self, vec: Vector):
-        floats = [str(round(v, 6)) for v in vec]
-        self.add_command('pos_s', 'xyz', ' '.join(floats))
-        self.vertex_size += 1
+    def add_tex(self, texcoord: tuple, width: int, height: int):
+        self.commands.add(CMD_TEX, texcoord[0], texcoord[1], width, height)
 
-    def add_pos_diff(self, vec: Vector):
-        floats = [str(round(v, 6)) for v in vec]
-        self.add_command('pos_diff', 'xyz', ' '.join(floats))
-        self.vertex_size += 1
+    def add_clr(self, color: tuple):
+        self.commands.add(CMD_CLR, *color)
 
-    def add_pos_yz(self, vec: Vector):
-        floats = [str(round(v, 6)) for v in [vec.y, vec.z]]
-        self.add_command('pos_yz', 'yz', ' '.join(floats))
-        self.vertex_size += 1
+    def add_nrm(self, normal: tuple):
+        self.commands.add(CMD_NRM, *normal)
 
-    def add_pos_xz(self, vec: Vector):
-        floats = [str(round(v, 6)) for v in [vec.x, vec.z]]
-        self.add_command('pos_xz', 'xz', ' '.join(floats))
-        self.vertex_size += 1
-
-    def add_pos_xy(self, vec: Vector):
-        floats = [str(round(v, 6)) for v in [vec.x, vec.y]]
-        self.add_command('pos_xy', 'xy', ' '.join(floats))
+    def get_pos_commands(self, pos: tuple):
+        """
+        Returns every command, as opcode and operands, that can set the
+        position after the previous position of this primitive.
+        """
+        commands = []
+        if not self.is_empty():
+            diff = tuple(a - b for a, b in zip(pos, self._previous_pos))
+            if diff[0] == 0:
+                commands.append((CMD_POS_YZ, pos))
+            if diff[1] == 0:
+                commands.append((CMD_POS_XZ, pos))
+            if diff[2] == 0:
+                commands.append((CMD_POS_XY, pos))
+            if is_pos_diff(diff):
+                commands.append((CMD_POS_DIFF, diff))
+        if is_pos_s(pos):
+            commands.append((CMD_POS_S, pos))
+        commands.append((CMD_POS_XYZ, pos))
+        return commands
+
+    def add_pos(self, pos: tuple):
+        """
+        Adds the smallest command that sets the position, pos is in FX32.
+        """
+        opcode, operands = min(self.get_pos_commands(pos),
+                               key=lambda x: get_command_size(x[0]))
+        self.commands.add(opcode, *operands)
         self.vertex_size += 1
+        self._previous_pos = pos
+
+
+def get_vertex_attributes(obj, material):
+    """
+    Returns if the vertices of a material on obj use texture coordinates,
+    colors and normals.
+    """
+    use_clr = len(obj.data.vertex_colors) > 0 and "vc" in material.type
+
+    use_tex = (material.image_idx != -1 and "tx" in material.type
+               and material.tex_gen_mode != "nrm"
+               and material.tex_gen_st_src != "material")
+
+    use_nrm = ((material.light0 == 'on' or
+                material.light1 == 'on' or
+                material.light2 == 'on' or
+                material.light3 == 'on') and "nr" in material.type) or \
+        material.tex_gen_mode == "nrm"
+
+    return use_tex, use_clr, use_nrm
+
+
+def partition_matrix_sets(matrix_sets, limit):
+    """
+    Splits primitives into groups that use at most limit matrices each,
+    matrix_sets has the set of matrices of every primitive. A group is
+    filled with the primitive that adds the fewest new matrices first, so
+    primitives that share matrices end up together. Returns lists of
+    primitive indexes, in their original order. Every primitive must use
+    at most limit matrices.
+    """
+    for matrices in matrix_sets:
+        if len(matrices) > limit:
+            raise Exception(f"A primitive uses {len(matrices)} matrices, "
+                            f"more than the limit of {limit}.")
+    if len(set().union(*matrix_sets)) <= limit:
+        return [list(range(len(matrix_sets)))]
+    users = {}
+    for idx, matrices in enumerate(matrix_sets):
+        for matrix in matrices:
+            users.setdefault(matrix, []).append(idx)
+
+    assigned = [False] * len(matrix_sets)
+    remaining = len(matrix_sets)
+    groups = []
+    while remaining:
+        # Number of matrices every primitive adds to the group.
+        missing = [len(matrices) for matrices in matrix_sets]
+        heap = [(missing[idx], idx) for idx in range(len(matrix_sets))
+                if not assigned[idx]]
+        heapq.heapify(heap)
+        used = set()
+        group = []
+        while heap:
+            count, idx = heapq.heappop(heap)
+            if assigned[idx] or count != missing[idx]:
+                continue
+            if len(used) + count > limit:
+                break
+            assigned[idx] = True
+            remaining -= 1
+            group.append(idx)
+            for matrix in matrix_sets[idx] - used:
+                used.add(matrix)
+                for user in users[matrix]:
+                    if not assigned[user]:
+                        missing[user] -= 1
+                        heapq.heappush(heap, (missing[user], user))
+        groups.append(sorted(group))
+    return groups
 
 
 class NitroModelMtxPrim():
@@ -295,34 +538,18 @@ class NitroModelMtxPrim():
             primitive.sort_key = 0
             primitive.quad_size += int((prim.vertex_count - 2) / 2)
 
-        if len(obj.data.vertex_colors) > 0 and "vc" in material.type:
+        use_tex, use_clr, use_nrm = get_vertex_attributes(obj, material)
+        if use_clr:
             self.parent_polygon.use_clr = True
-
-        if material.image_idx != -1 and "tx" in material.type \
-                and material.tex_gen_mode != "nrm" \
-                and material.tex_gen_st_src != "material":
+        if use_tex:
             self.parent_polygon.use_tex = True
-
-        if ((material.light0 == 'on' or
-            material.light1 == 'on' or
-            material.light2 == 'on' or
-            material.light3 == 'on') and "nr" in material.type) or \
-                material.tex_gen_mode == "nrm":
+        if use_nrm:
             self.parent_polygon.use_nrm = True
 
-        for idx in range(len(prim.positions)):
+        store = prim.store
+        for vertex in prim.vertices:
             # Find transform.
-            group = prim.groups[idx]
-            matrix = None
-            if (model.settings['imd_compress_nodes']
-               in ['unite', 'unite_combine']):
-                matrix = model.find_matrix_by_node_name('root_scene')
-                group = -1
-            elif group != -1:
-                name = obj.vertex_groups[group].name
-                matrix = model.find_matrix_by_node_name(name)
-            else:
-                matrix = model.find_matrix_by_node_name(obj.name)
+            matrix = model.get_vertex_matrix(obj, store.groups[vertex])
 
             node = model.find_node_by_index(matrix.node_idx)
             node.draw_mtx = True
@@ -335,59 +562,31 @@ class NitroModelMtxPrim():
                 primitive._previous_nrm = None
 
             # Texture coordinate.
+            texcoord = store.get_texcoord(vertex)
             if (self.parent_polygon.use_tex
-               and primitive._previous_tex != prim.texcoords[idx]):
-                primitive._previous_tex = prim.texcoords[idx]
+               and primitive._previous_tex != texcoord):
+                primitive._previous_tex = texcoord
                 tex = model.textures[material.image_idx]
-                uv = prim.texcoords[idx].to_vector()
-                s = uv.x * tex.width
-                t = uv.y * -tex.height + tex.height
-                primitive.add_command('tex', 'st', f'{s} {t}')
+                primitive.add_tex(texcoord, tex.width, tex.height)
 
             # Color
+            color = store.get_color(vertex)
             if (self.parent_polygon.use_clr
-               and primitive._previous_clr != prim.colors[idx]):
-                primitive._previous_clr = prim.colors[idx]
-                r, g, b = prim.colors[idx]
-                primitive.add_command('clr', 'rgb', f'{r} {g} {b}')
+               and primitive._previous_clr != color):
+                primitive._previous_clr = color
+                primitive.add_clr(color)
 
             # Normal
+            normal = store.get_normal(vertex)
             if (self.parent_polygon.use_nrm
-               and primitive._previous_nrm != prim.normals[idx]):
-                primitive._previous_nrm = prim.normals[idx]
-                normal = prim.normals[idx].to_vector()
-                primitive.add_command('nrm', 'xyz',
-                                      f'{normal.x} {normal.y} {normal.z}')
+               and primitive._previous_nrm != normal):
+                primitive._previous_nrm = normal
+                primitive.add_nrm(normal)
 
             # Recalculate vertex.
-            scaled_vecfx32 = prim.positions[idx] >> model.info.pos_scale
-            scaled_vec = scaled_vecfx32.to_vector()
-
-            # Calculate difference from previous vertex.
-            if not primitive.is_empty():
-                diff_vecfx32 = scaled_vecfx32 - primitive._previous_vecfx32
-                diff_vec = diff_vecfx32.to_vector()
-
-            # PosYZ
-            if not primitive.is_empty() and diff_vecfx32.x == 0:
-                primitive.add_pos_yz(scaled_vec)
-            # PosXZ
-            elif not primitive.is_empty() and diff_vecfx32.y == 0:
-                primitive.add_pos_xz(scaled_vec)
-            # PosXY
-            elif not primitive.is_empty() and diff_vecfx32.z == 0:
-                primitive.add_pos_xy(scaled_vec)
-            # PosDiff
-            elif not primitive.is_empty() and is_pos_diff(diff_vecfx32):
-                primitive.add_pos_diff(diff_vec)
-            # PosShort
-            elif is_pos_s(scaled_vecfx32):
-                primitive.add_pos_s(scaled_vec)
-            # PosXYZ
-            else:
-                primitive.add_pos_xyz(scaled_vec)
-
-            primitive._previous_vecfx32 = scaled_vecfx32
+            pos_scale = model.info.pos_scale
+            scaled = tuple(v >> pos_scale for v in store.get_position(vertex))
+            primitive.add_pos(scaled)
 
     def get_primitive(self, type_):
         if type_ != 'quad_strip' and type_ != 'triangle_strip':
@@ -401,15 +600,31 @@ class NitroModelMtxPrim():
         self.primitives[0].insert_mtx(0, 0)
 
     def optimize(self):
-        previous_mtx = None
+        """
+        Removes mtx, tex, clr and nrm commands that set the state that is
+        already set, also across the primitives of this mtx_prim. Returns
+        the number of removed commands.
+        """
+        removed = 0
+        state = {}
         for primitive in self.primitives:
-            for command in primitive.commands:
-                if command.type != 'mtx':
-                    continue
-                if previous_mtx == command.data:
-                    primitive.commands.remove(command)
-                else:
-                    previous_mtx = command.data
+            commands = NitroModelCommandBuffer()
+            for opcode, operands in primitive.commands:
+                if opcode in STATE_COMMANDS:
+                    if state.get(opcode) == operands:
+                        removed += 1
+                        continue
+                    state[opcode] = operands
+                    # A normal is transformed by the current matrix and with
+                    # lighting it sets the vertex color, so a normal after a
+                    # mtx or clr and a clr after a nrm are never redundant.
+                    if opcode in (CMD_MTX, CMD_CLR):
+                        state.pop(CMD_NRM, None)
+                    elif opcode == CMD_NRM:
+                        state.pop(CMD_CLR, None)
+                commands.add(opcode, *operands)
+            primitive.commands = commands
+        return removed
 
 
 class NitroModelPolygon():
@@ -420,17 +635,18 @@ class NitroModelPolygon():
         self.use_clr = False
         self.use_tex = False
         self.mtx_prims = []
+        self.mtx_prims_by_index = {}
         self.vertex_size = 0
         self.polygon_size = 0
         self.triangle_size = 0
         self.quad_size = 0
 
     def find_mtx_prim(self, index):
-        for prim in self.mtx_prims:
-            if prim.index == index:
-                return prim
+        if index in self.mtx_prims_by_index:
+            return self.mtx_prims_by_index[index]
         index = len(self.mtx_prims)
         self.mtx_prims.append(NitroModelMtxPrim(index, self))
+        self.mtx_prims_by_index[index] = self.mtx_prims[-1]
         return self.mtx_prims[-1]
 
     def collect_statistics(self):
@@ -443,8 +659,24 @@ class NitroModelPolygon():
                 self.quad_size += primitive.quad_size
 
     def optimize(self):
+        removed = 0
         for mtx_prim in self.mtx_prims:
-            mtx_prim.optimize()
+            removed += mtx_prim.optimize()
+        return removed
+
+    def get_display_list_size(self):
+        """
+        Size in bytes of the display list of this polygon when all of its
+        primitives are packed one after the other.
+        """
+        command_count = 0
+        param_size = 0
+        for mtx_prim in self.mtx_prims:
+            for primitive in mtx_prim.primitives:
+                command_count += len(primitive.commands) + 1
+                param_size += primitive.commands.get_param_size()
+                param_size += BEGIN_VTXS_PARAM_SIZE
+        return get_packed_size(command_count, param_size)
 
 
 class NitroModelDisplay():
@@ -472,6 +704,8 @@ class NitroModelNode():
         self.mtx = None
         self.visibility = True
         self.displays = []
+        # Displays by material and polygon index.
+        self.display_keys = {}
         self.vertex_size = 0
         self.polygon_size = 0
         self.triangle_size = 0
@@ -492,15 +726,22 @@ class NitroModelNode():
             self.quad_size += polygon.quad_size
 
     def find_display(self, material_index, polygon_index):
-        for display in self.displays:
-            if (display.material == material_index
-               and display.polygon == polygon_index):
-                return display
+        key = (material_index, polygon_index)
+        if key in self.display_keys:
+            return self.display_keys[key]
         index = len(self.displays)
         self.displays.append(NitroModelDisplay(
             index, material_index, polygon_index))
+        self.display_keys[key] = self.displays[-1]
         return self.displays[-1]
 
+    def set_displays(self, displays):
+        self.displays = displays
+        self.display_keys = {}
+        for display in displays:
+            key = (display.material, display.polygon)
+            self.display_keys.setdefault(key, display)
+
 
 class NitroModelOutputInfo():
     def __init__(self):
@@ -528,12 +769,34 @@ class NitroModel():
         self.matrices = []
         self.polygons = []
         self.nodes = []
+        # Indexes of the lists above, kept up to date by the find, remove
+        # and replace functions.
+        self.textures_by_path = {}
+        self.materials_by_index = {}
+        self.matrices_by_node = {}
+        self.polygons_by_name = {}
+        self.nodes_by_name = {}
+        self.nodes_by_index = {}
         self.output_info = NitroModelOutputInfo()
         self.settings = settings
         # Array with primitives and their objects.
         self.primitives = []
+        self.texture_cache = None
+        # Texture data loaded by prefetch_textures, by path.
+        self.texture_data = {}
+        if settings['texture_cache_dir']:
+            self.texture_cache = TextureCache(
+                bpy.path.abspath(settings['texture_cache_dir']),
+                settings['texture_cache_size'] * 1024 * 1024)
 
     def collect(self):
+        # The UI limits this setting, but the batch export and scripts
+        # don't use the UI.
+        limit = self.settings['imd_mtx_list_size']
+        if not 4 <= limit <= 31:
+            raise Exception(f"Matrices per mtx_prim is {limit}, it must be "
+                            f"between 4 and 31.")
+
         if self.settings['imd_compress_nodes'] in ['none', 'cull', 'merge']:
             self.collect_none()
         elif self.settings['imd_compress_nodes'] == 'unite':
@@ -542,16 +805,35 @@ class NitroModel():
             self.collect_unite_combine()
 
         # Sort and collect statistics.
-        for polygon in self.polygons:
-            polygon.collect_statistics()
-            for mtx_prim in polygon.mtx_prims:
-                mtx_prim.primitives.sort(key=lambda x: x.sort_key)
-        for node in self.nodes:
-            node.collect_statistics(self)
+        with profiler.stage('statistics'):
+            for polygon in self.polygons:
+                polygon.collect_statistics()
+                for mtx_prim in polygon.mtx_prims:
+                    mtx_prim.primitives.sort(key=lambda x: x.sort_key)
+            for node in self.nodes:
+                node.collect_statistics(self)
 
         # Optimise polygons.
+        removed = 0
+        with profiler.stage('optimize'):
+            for polygon in self.polygons:
+                removed += polygon.optimize()
+        profiler.count('optimize', len(self.polygons))
+        logger.log(f"Removed {removed} redundant commands.")
+
+        # Report the size of the display lists.
+        total_size = 0
         for polygon in self.polygons:
-            polygon.optimize()
+            size = polygon.get_display_list_size()
+            total_size += size
+            per_polygon = size / max(polygon.polygon_size, 1)
+            logger.log(f"Polygon {polygon.name}: {size} display list bytes, "
+                       f"{per_polygon:.2f} bytes per polygon.")
+        logger.log(f"Display lists: {total_size} bytes.")
+
+        if self.texture_cache:
+            logger.log(f"Texture cache: {self.texture_cache.hits} hits, "
+                       f"{self.texture_cache.misses} misses.")
 
         self.output_info.collect(self)
 
@@ -568,6 +850,7 @@ class NitroModel():
         root.child = children[0].index
         self.apply_transformations()
         self.info.calculate()
+        self.prefetch_textures()
         for item in self.primitives:
             self.compile_primitives(
                 item['primitives'],
@@ -578,27 +861,46 @@ class NitroModel():
         if self.settings['imd_compress_nodes'] in ['cull', 'merge']:
             self.cull_nodes()
 
+    @profiler.stage('cull_nodes')
     def cull_nodes(self):
+        """
+        Removes every node that has no matrix and only has children that
+        are removed as well. The root gets the displays of the last node
+        that is removed.
+        """
         root = self.find_node('root_scene')
-        while True:
-            node = self.get_childless_node()
-            if node is not None:
-                root.displays = node.displays
-                self.remove_node(node)
-            else:
-                break
+        culled = set()
+        last = None
+        # Post-order walk, so children are culled before their parents.
+        trees = [node for node in self.nodes
+                 if node.parent == -1 and node is not root]
+        stack = [(node, False) for node in reversed(trees)]
+        stack.append((root, False))
+        while stack:
+            node, visited = stack.pop()
+            children = self.get_node_children(node)
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+            if node is root or self.node_has_matrix(node):
+                continue
+            if all(child.index in culled for child in children):
+                culled.add(node.index)
+                last = node
+        if last is not None:
+            root.set_displays(last.displays)
+        self.remove_nodes(culled)
+
         child = self.find_node_by_index(root.child)
         if child.brother_next == -1:
             mtx = Matrix.Rotation(math.radians(-90), 4, 'X')
             child.mtx = mtx @ child.mtx
             child.set_scale_rot_trans(self.settings['imd_magnification'])
-            child.displays = root.displays
+            child.set_displays(root.displays)
             child.parent = -1
-            self.nodes.remove(root)
-        idx = 0
-        for node in self.nodes:
-            self.node_replace_index(node, idx)
-            idx += 1
+            self.remove_nodes({root.index})
+        self.reindex_nodes()
 
     def collect_unite(self):
         root = self.find_node('root_scene')
@@ -608,6 +910,7 @@ class NitroModel():
             self.process_mesh(root, obj)
         self.apply_transformations()
         self.info.calculate()
+        self.prefetch_textures()
         for item in self.primitives:
             self.compile_primitives(
                 item['primitives'],
@@ -623,6 +926,7 @@ class NitroModel():
             self.process_mesh(root, obj)
         self.apply_transformations()
         self.info.calculate()
+        self.prefetch_textures()
         for item in self.primitives:
             self.compile_primitives_combined(
                 item['primitives'],
@@ -630,7 +934,11 @@ class NitroModel():
                 item['node'],
             )
 
+    @profiler.stage('compile_primitives')
     def compile_primitives_combined(self, primitives, obj, node):
+        profiler.count('compile_primitives', len(primitives))
+        if self.settings['imd_reorder_primitives']:
+            primitives = self.reorder_primitives(primitives, obj)
         poly_mats = []
         for primitive in primitives:
             material = self.find_material(primitive.material_index)
@@ -642,66 +950,139 @@ class NitroModel():
             display = node.find_display(material.index, polygon.index)
             display.polygon = polygon.index
 
+    @profiler.stage('compile_primitives')
     def compile_primitives(self, primitives, obj, node):
+        profiler.count('compile_primitives', len(primitives))
+        if self.settings['imd_reorder_primitives']:
+            primitives = self.reorder_primitives(primitives, obj)
         # A list of polygons and materials.
         poly_mats = []
-        # Make materials and polygons and add the primitives to their
-        # respective mtx_prim elements.
+        # The material, primitives and their matrices of every polygon.
+        polygons = {}
+        limit = self.settings['imd_mtx_list_size']
+        # Make materials and polygons and find the matrices of the
+        # primitives. Strips with too many matrices are split.
         for primitive in primitives:
             material = self.find_material(primitive.material_index)
             polygon_name = obj.name + '_' + str(material.index)
             polygon = self.find_polygon(polygon_name)
             poly_mats.append((polygon, material))
-            mtx_prim = polygon.find_mtx_prim(0)
-            logger.log(f"Add primitive. {primitive.type}")
-            mtx_prim.add_primitive(self, obj, primitive, material)
+            if polygon.index not in polygons:
+                polygons[polygon.index] = (polygon, material, [], [])
+            matrices = [self.get_vertex_matrix(obj, group).index
+                        for group in primitive.get_groups()]
+            for piece in primitive.split(matrices, limit):
+                polygons[polygon.index][2].append(piece)
+                polygons[polygon.index][3].append(set(
+                    self.get_vertex_matrix(obj, group).index
+                    for group in piece.get_groups()))
+        # Add the primitives to mtx_prim elements that each fit in the
+        # matrix stack.
+        for polygon, material, prims, matrix_sets in polygons.values():
+            groups = partition_matrix_sets(matrix_sets, limit)
+            for index, group in enumerate(groups):
+                mtx_prim = polygon.find_mtx_prim(index)
+                for idx in group:
+                    logger.debug("Add primitive. %s", prims[idx].type)
+                    mtx_prim.add_primitive(self, obj, prims[idx], material)
         # Hook up each polygon to the proper display depending on
         # material index.
         for polygon, material in poly_mats:
             display = node.find_display(material.index, polygon.index)
             display.polygon = polygon.index
 
+    def reorder_primitives(self, primitives, obj):
+        """
+        Orders the primitives of every material and primitive type so that
+        fewer state changes are needed between them. Materials keep the
+        order in which they first appear.
+        """
+        use_mtx = self.settings['imd_compress_nodes'] not in [
+            'unite', 'unite_combine']
+        groups = {}
+        for primitive in primitives:
+            key = (primitive.material_index, primitive.type)
+            groups.setdefault(key, []).append(primitive)
+
+        result = []
+        before = 0
+        after = 0
+        for (material_index, _), group in groups.items():
+            material = self.find_material(material_index)
+            sorter = PrimitiveSorter(
+                use_mtx, *get_vertex_attributes(obj, material))
+            before += sorter.count_state_changes(group)
+            group = sorter.process(group)
+            after += sorter.count_state_changes(group)
+            result.extend(group)
+        logger.log(f"Reordered primitives of {obj.name}. State changes "
+                   f"before: {before}, after: {after}.")
+        return result
+
+    @profiler.stage('apply_transformations')
     def apply_transformations(self):
+        unite = self.settings['imd_compress_nodes'] in ['unite',
+                                                        'unite_combine']
+        magnification = np.float32(self.settings['imd_magnification'])
+        # Inverted matrices of the nodes of vertex groups, with their
+        # rotation for the normals, by node name.
+        transforms = {}
         for item in self.primitives:
             obj = item['obj']
+            store = item['store']
+            # Every vertex of the store is transformed once, even when it is
+            # used by several primitives. Keep the order of first use, nodes
+            # and matrices are created in that order.
+            vertices = {}
             for primitive in item['primitives']:
-                for idx in range(len(primitive.positions)):
-                    vertex = primitive.positions[idx].to_vector()
-                    if self.settings['imd_compress_nodes'] in ['unite', 'unite_combine']:
-                        transform = axis_conversion(
-                            to_forward='-Z', to_up='Y').to_4x4()
-                        transform = transform @ obj.matrix_world
-                        vertex = transform @ vertex
-                    else:
-                        matrix = None
-                        group = primitive.groups[idx]
-                        if group != -1:
-                            name = obj.vertex_groups[group].name
-                            matrix = self.find_matrix_by_node_name(name)
-                        if matrix:
-                            vertex = matrix.transform.inverted() @ vertex
-                    vertex = vertex * self.settings['imd_magnification']
-                    self.info.add(vertex)
-                    vecfx32_vertex = VecFx32().from_vector(vertex)
-                    primitive.positions[idx] = vecfx32_vertex
-                for idx in range(len(primitive.normals)):
-                    if self.settings['imd_compress_nodes'] in ['unite', 'unite_combine']:
-                        normal = primitive.normals[idx].to_vector()
-                        transform = axis_conversion(
-                            to_forward='-Z', to_up='Y').to_4x4()
-                        transform = transform @ obj.matrix_world
-                        quat = transform.to_quaternion()
-                        normal = quat @ normal
-                        primitive.normals[idx] = vector_to_vecfx10(normal)
-                    else:
-                        group = primitive.groups[idx]
-                        if group != -1:
-                            name = obj.vertex_groups[group].name
-                            matrix = self.find_matrix_by_node_name(name)
-                            normal = primitive.normals[idx].to_vector()
-                            quat = matrix.transform.inverted().to_quaternion()
-                            normal = quat @ normal
-                            primitive.normals[idx] = vector_to_vecfx10(normal)
+                vertices.update(dict.fromkeys(primitive.vertices))
+            indices = np.fromiter(vertices, dtype=np.int64,
+                                  count=len(vertices))
+            profiler.count('apply_transformations', len(indices))
+            positions = store.get_array(store.positions, 3)
+            normals = store.get_array(store.normals, 3)
+            vertex_positions = (positions[indices] / 4096).astype(np.float32)
+            vertex_normals = (normals[indices] / 512).astype(np.float32)
+
+            if unite:
+                transform = axis_conversion(
+                    to_forward='-Z', to_up='Y').to_4x4()
+                transform = transform @ obj.matrix_world
+                batches = [(slice(None), transform,
+                            transform.to_quaternion())]
+            else:
+                groups = store.get_array(store.groups, 1)[indices, 0]
+                batches = self.get_group_transforms(obj, groups, transforms)
+
+            for selection, transform, quat in batches:
+                vertex_positions[selection] = transform_positions(
+                    transform, vertex_positions[selection])
+                vertex_normals[selection] = rotate_normals(
+                    quat, vertex_normals[selection])
+
+            vertex_positions *= magnification
+            self.info.add(vertex_positions)
+            positions[indices] = floats_to_fx32(vertex_positions)
+            normals[indices] = floats_to_fx10(vertex_normals)
+
+    def get_group_transforms(self, obj, groups, transforms):
+        """
+        Returns the vertices of every vertex group in groups with the
+        transform and rotation to apply to them. Vertices without a group
+        are not transformed.
+        """
+        batches = []
+        values, first = np.unique(groups, return_index=True)
+        for group in values[np.argsort(first)]:
+            if group == -1:
+                continue
+            name = obj.vertex_groups[group].name
+            if name not in transforms:
+                matrix = self.find_matrix_by_node_name(name)
+                inverted = matrix.transform.inverted()
+                transforms[name] = (inverted, inverted.to_quaternion())
+            batches.append((groups == group, *transforms[name]))
+        return batches
 
     def process_children(self, parent, objs):
         """
@@ -815,38 +1196,47 @@ class NitroModel():
 
         return brothers
 
+    @profiler.stage('process_mesh')
     def process_mesh(self, node, obj):
         primitives = []
+        vertex_keys = VertexKeys()
 
         # fix copied from fast64 repo, in blender version 4.1 func was removed, in 4.1+ normals are always calculated
         if bpy.app.version < (4, 1, 0):
             obj.data.calc_normals_split()
 
+        store = PrimitiveStore(MeshData(obj))
+
         for polygon in obj.data.polygons:
             if len(polygon.loop_indices) > 4:
-                logger.log("Polygon is ngon. Skipped.")
+                logger.log_repeated("Polygon is ngon. Skipped.",
+                                    logger.WARNING)
                 continue
             if len(polygon.loop_indices) < 3:
-                logger.log("Polygon is a line. Skipped.")
+                logger.log_repeated("Polygon is a line. Skipped.",
+                                    logger.WARNING)
                 continue
             index = get_global_mat_index(obj, polygon.material_index)
             if index == -1:
-                logger.log("Polygon doesn't have material. Skipped.")
+                logger.log_repeated("Polygon doesn't have material. Skipped.",
+                                    logger.WARNING)
                 continue
 
             # Add polygon to the list of primitives.
-            primitives.append(Primitive(obj, polygon))
+            primitives.append(store.add_polygon(polygon, index))
+        profiler.count('process_mesh', len(primitives))
 
         if self.settings['imd_use_primitive_strip']:
-            quad_stripper = QuadStripper()
+            quad_stripper = QuadStripper(vertex_keys)
             primitives = quad_stripper.process(primitives)
 
-            tri_stripper = TriStripper()
+            tri_stripper = TriStripper(vertex_keys)
             primitives = tri_stripper.process(primitives)
 
         self.primitives.append({
             'obj': obj,
             'node': node,
+            'store': store,
             'primitives': primitives
         })
 
@@ -855,98 +1245,159 @@ class NitroModel():
             NitroModelPalette(name, data, size, len(self.palettes)))
         return self.palettes[-1]
 
+    def read_texture(self, path):
+        """
+        Loads the texture at path, from the texture cache if there is one.
+        """
+        if self.texture_cache:
+            return self.texture_cache.load(path, read_texture)
+        return read_texture(path)
+
+    @profiler.stage('prefetch_textures')
+    def prefetch_textures(self):
+        """
+        Loads the textures of the materials that the primitives use in
+        parallel. Textures are still added to the model by find_texture, so
+        their order and the order of the palettes doesn't change.
+        """
+        material_indices = {}
+        for item in self.primitives:
+            for primitive in item['primitives']:
+                material_indices[primitive.material_index] = None
+        paths = {}
+        for index in material_indices:
+            image_path, frame_paths = get_texture_paths(
+                bpy.data.materials[index])
+            if image_path is not None:
+                paths[image_path] = None
+            paths.update(dict.fromkeys(frame_paths))
+        if not paths:
+            return
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = {path: executor.submit(self.read_texture, path)
+                       for path in paths}
+        for path, future in futures.items():
+            # Textures that fail to load are loaded again by find_texture,
+            # which reports the error if the texture is used.
+            if future.exception() is None:
+                self.texture_data[path] = future.result()
+
     def find_texture(self, path):
-        for texture in self.textures:
-            if texture.path == path:
-                return texture
-        self.textures.append(NitroModelTexture(self, path, len(self.textures)))
+        if path in self.textures_by_path:
+            return self.textures_by_path[path]
+        data = self.texture_data.pop(path, None)
+        if data is None:
+            data = self.read_texture(path)
+        self.textures.append(
+            NitroModelTexture(self, path, len(self.textures), data))
+        self.textures_by_path[path] = self.textures[-1]
         return self.textures[-1]
 
     def find_material(self, blender_index):
-        for material in self.materials:
-            if material.blender_index == blender_index:
-                return material
+        if blender_index in self.materials_by_index:
+            return self.materials_by_index[blender_index]
         index = len(self.materials)
         self.materials.append(NitroModelMaterial(self, blender_index, index))
+        self.materials_by_index[blender_index] = self.materials[-1]
         return self.materials[-1]
 
     def find_matrix(self, node_idx, matrix_):
-        for matrix in self.matrices:
-            if matrix.node_idx == node_idx:
-                return matrix
+        if node_idx in self.matrices_by_node:
+            return self.matrices_by_node[node_idx]
         index = len(self.matrices)
         self.matrices.append(NitroModelMatrix(index, node_idx, matrix_))
+        self.matrices_by_node[node_idx] = self.matrices[-1]
         return self.matrices[-1]
 
+    def get_vertex_matrix(self, obj, group):
+        """
+        Returns the matrix of a vertex of obj in the given vertex group.
+        """
+        if self.settings['imd_compress_nodes'] in ['unite', 'unite_combine']:
+            return self.find_matrix_by_node_name('root_scene')
+        elif group != -1:
+            return self.find_matrix_by_node_name(obj.vertex_groups[group].name)
+        return self.find_matrix_by_node_name(obj.name)
+
     def find_matrix_by_node_name(self, name):
         node = self.find_node(name)
-        for matrix in self.matrices:
-            if matrix.node_idx == node.index:
-                return matrix
         return self.find_matrix(node.index, Matrix.Identity(4))
 
-    def get_childless_node(self):
-        for node in self.nodes:
-            if node.child == -1 and not self.node_has_matrix(node):
-                return node
-        return None
-
-    def remove_node(self, node):
-        for other in self.nodes:
-            if other.child == node.index:
-                if node.brother_next == -1:
-                    other.child = -1
-                else:
-                    other.child = node.brother_next
-            if other.brother_next == node.index:
-                other.brother_next = node.brother_next
-            if other.brother_prev == node.index:
-                other.brother_prev = node.brother_prev
-            if other.parent == node.index:
-                raise Exception("Attempting to delete a parent node")
-        self.nodes.remove(node)
+    def get_node_children(self, node):
+        children = []
+        child = self.find_node_by_index(node.child)
+        while child is not None:
+            children.append(child)
+            child = self.find_node_by_index(child.brother_next)
+        return children
 
-    def node_replace_index(self, node, index):
-        for other in self.nodes:
-            if other.index == node.index:
+    def remove_nodes(self, indexes):
+        """
+        Removes the nodes with the given indexes. Links to removed nodes
+        are moved to the next brother that is not removed.
+        """
+        def follow(index, attr):
+            while index in indexes:
+                index = getattr(self.nodes_by_index[index], attr)
+            return index
+
+        for node in self.nodes:
+            if node.index in indexes:
                 continue
-            if other.child == node.index:
-                other.child = index
-            if other.brother_next == node.index:
-                other.brother_next = index
-            if other.brother_prev == node.index:
-                other.brother_prev = index
-            if other.parent == node.index:
-                other.parent = index
+            if node.parent in indexes:
+                raise Exception("Attempting to delete a parent node")
+            node.child = follow(node.child, 'brother_next')
+            node.brother_next = follow(node.brother_next, 'brother_next')
+            node.brother_prev = follow(node.brother_prev, 'brother_prev')
+        for index in indexes:
+            node = self.nodes_by_index.pop(index)
+            if self.nodes_by_name.get(node.name) is node:
+                del self.nodes_by_name[node.name]
+        self.nodes = [node for node in self.nodes
+                      if node.index not in indexes]
+
+    def reindex_nodes(self):
+        """
+        Gives the nodes the index of their position in the node list and
+        updates all links to them.
+        """
+        remap = {}
+        for index, node in enumerate(self.nodes):
+            remap[node.index] = index
+        for node in self.nodes:
+            node.index = remap[node.index]
+            node.parent = remap.get(node.parent, node.parent)
+            node.child = remap.get(node.child, node.child)
+            node.brother_next = remap.get(node.brother_next,
+                                          node.brother_next)
+            node.brother_prev = remap.get(node.brother_prev,
+                                          node.brother_prev)
+        for matrix in self.matrices:
+            matrix.node_idx = remap.get(matrix.node_idx, matrix.node_idx)
+        self.nodes_by_index = {node.index: node for node in self.nodes}
+        self.matrices_by_node = {}
         for matrix in self.matrices:
-            if matrix.node_idx == node.index:
-                matrix.node_idx = index
-        node.index = index
+            self.matrices_by_node.setdefault(matrix.node_idx, matrix)
 
     def node_has_matrix(self, node):
-        for matrix in self.matrices:
-            if matrix.node_idx == node.index:
-                return True
-        return False
+        return node.index in self.matrices_by_node
 
     def find_polygon(self, name):
-        for polygon in self.polygons:
-            if polygon.name == name:
-                return polygon
+        if name in self.polygons_by_name:
+            return self.polygons_by_name[name]
         index = len(self.polygons)
         self.polygons.append(NitroModelPolygon(index, name))
+        self.polygons_by_name[name] = self.polygons[-1]
         return self.polygons[-1]
 
     def find_node(self, name):
-        for node in self.nodes:
-            if node.name == name:
-                return node
+        if name in self.nodes_by_name:
+            return self.nodes_by_name[name]
         index = len(self.nodes)
         self.nodes.append(NitroModelNode(index, name))
+        self.nodes_by_name[name] = self.nodes[-1]
+        self.nodes_by_index[index] = self.nodes[-1]
         return self.nodes[-1]
 
     def find_node_by_index(self, index):
-        for node in self.nodes:
-            if node.index == index:
-                return node
-        return None
+        return self.nodes_by_index.get(index)
@@ -1,108 +1,123 @@
-def read_tga_header(f):
+import mmap
+import struct
+import numpy as np
+from contextlib import contextmanager
+
+
+TGA_HEADER = struct.Struct('<BBBHHBHHHHBB')
+TGA_HEADER_FIELDS = [
+    'id_field_length',
+    'color_map_type',
+    'image_type',
+    'color_map_origin',
+    'color_map_length',
+    'color_map_entry_size',
+    'image_x_origin',
+    'image_y_origin',
+    'image_width',
+    'image_heigth',
+    'image_pixel_size',
+    'image_descriptor',
+]
+NITRO_TGA_ID = struct.Struct('<16sI')
+NITRO_TGA_CHUNK = struct.Struct('<8sI')
+
+
+def read_tga_header(data):
+    return dict(zip(TGA_HEADER_FIELDS, TGA_HEADER.unpack_from(data, 0)))
+
+
+def read_nitro_tga_id(data):
+    version, offset = NITRO_TGA_ID.unpack_from(data, TGA_HEADER.size)
     return {
-        'id_field_length': int.from_bytes(f.read(1), byteorder='little'),
-        'color_map_type': int.from_bytes(f.read(1), byteorder='little'),
-        'image_type': int.from_bytes(f.read(1), byteorder='little'),
-        'color_map_origin': int.from_bytes(f.read(2), byteorder='little'),
-        'color_map_length': int.from_bytes(f.read(2), byteorder='little'),
-        'color_map_entry_size': int.from_bytes(f.read(1), byteorder='little'),
-        'image_x_origin': int.from_bytes(f.read(2), byteorder='little'),
-        'image_y_origin': int.from_bytes(f.read(2), byteorder='little'),
-        'image_width': int.from_bytes(f.read(2), byteorder='little'),
-        'image_heigth': int.from_bytes(f.read(2), byteorder='little'),
-        'image_pixel_size': int.from_bytes(f.read(1), byteorder='little'),
-        'image_descriptor': int.from_bytes(f.read(1), byteorder='little'),
+        'version': version.decode('utf-8').replace('\x00', ''),
+        'nitro_data_offset': offset
     }
 
 
-def read_nitro_tga_id(f):
+def read_nitro_tga_chunks(data, offset):
+    """
+    Returns the payload of every Nitro TGA chunk by signature, as slices
+    of data. Reading stops at the nns_endb chunk.
+    """
+    chunks = {}
+    while offset + NITRO_TGA_CHUNK.size <= len(data):
+        sig, length = NITRO_TGA_CHUNK.unpack_from(data, offset)
+        sig = sig.decode('ascii')
+        if sig == 'nns_endb':
+            return chunks
+        if length < NITRO_TGA_CHUNK.size or offset + length > len(data):
+            raise Exception(f"Nitro TGA chunk {sig} at offset {offset} has "
+                            f"an invalid length of {length}")
+        chunks[sig] = data[offset + NITRO_TGA_CHUNK.size:offset + length]
+        offset += length
+    return chunks
+
+
+def read_nitro_tga_data(data, offset):
+    chunks = read_nitro_tga_chunks(data, offset)
+
+    def read_string(sig, default=None):
+        if sig not in chunks:
+            return default
+        return bytes(chunks[sig]).decode('ascii')
+
     return {
-        'version': f.read(16).decode('utf-8').replace('\x00', ''),
-        'nitro_data_offset': int.from_bytes(f.read(4), byteorder='little')
+        'tex_format': read_string('nns_frmt'),
+        'texel_data': chunks.get('nns_txel'),
+        'pltt_idx_data': chunks.get('nns_pidx'),
+        'palette_name': read_string('nns_pnam', ''),
+        'palette': chunks.get('nns_pcol'),
+        'color_0_transp': 'nns_c0xp' in chunks,
+        'generator_name': read_string('nns_gnam'),
+        'generator_ver': read_string('nns_gver'),
+        'optpix_data': chunks.get('nns_imst')
     }
 
 
-def read_nitro_tga_data(f, offset):
-    color_0_transp = False
-    pltt_idx_data = None
-    optpix_data = None
-    palette_name = ''
-    palette = None
-
-    # Get the end of the file
-    f.seek(0, 2)
-    end_of_file = f.tell()
-
-    # Seek to Nitro TGA Data Offset
-    f.seek(offset)
-
-    while f.tell() + 12 <= end_of_file:
-        sig = f.read(8).decode('ascii')
-        length = int.from_bytes(f.read(4), byteorder='little')
-
-        if sig == 'nns_frmt':
-            tex_format = f.read(length - 12).decode('ascii')
-        elif sig == 'nns_txel':
-            texel_data = f.read(length - 12)
-        elif sig == 'nns_pidx':
-            pltt_idx_data = f.read(length - 12)
-        elif sig == 'nns_pnam':
-            palette_name = f.read(length - 12).decode('ascii')
-        elif sig == 'nns_pcol':
-            palette = f.read(length - 12)
-        elif sig == 'nns_c0xp':
-            color_0_transp = True
-        elif sig == 'nns_gnam':
-            generator_name = f.read(length - 12).decode('ascii')
-        elif sig == 'nns_gver':
-            generator_ver = f.read(length - 12).decode('ascii')
-        elif sig == 'nns_imst':
-            optpix_data = f.read(length - 12)
-        elif sig == 'nns_endb':
-            return {
-                'tex_format': tex_format,
-                'texel_data': texel_data,
-                'pltt_idx_data': pltt_idx_data,
-                'palette_name': palette_name,
-                'palette': palette,
-                'color_0_transp': color_0_transp,
-                'generator_name': generator_name,
-                'generator_ver': generator_ver,
-                'optpix_data': optpix_data
-            }
-
-
+@contextmanager
 def read_nitro_tga(path):
+    """
+    Reads the Nitro TGA at path. The file is mapped instead of read, the
+    chunk data are views on the mapping that are only loaded when they are
+    used. The mapping is closed and the views are released when the with
+    block ends, so convert the data inside of it.
+    """
     with open(path, "rb") as f:
-        header = read_tga_header(f)
-        nitro_tga_id = read_nitro_tga_id(f)
-        nitro_data = read_nitro_tga_data(f, nitro_tga_id['nitro_data_offset'])
-
-        f.close()
-
-    return {
-        'header': header,
-        'nitro_tga_id': nitro_tga_id,
-        'nitro_data': nitro_data,
-    }
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = memoryview(mapping)
+    nitro_data = {}
+    try:
+        header = read_tga_header(data)
+        nitro_tga_id = read_nitro_tga_id(data)
+        nitro_data = read_nitro_tga_data(
+            data, nitro_tga_id['nitro_data_offset'])
+        yield {
+            'header': header,
+            'nitro_tga_id': nitro_tga_id,
+            'nitro_data': nitro_data,
+        }
+    finally:
+        # A view that is still used, like a NumPy array held by an error
+        # raised in the with block, keeps the mapping open until it is
+        # garbage collected. The original error is raised then.
+        try:
+            for value in nitro_data.values():
+                if isinstance(value, memoryview):
+                    value.release()
+            data.release()
+            mapping.close()
+        except BufferError:
+            pass
 
 
 # These functions below purpose is inside the imd directly
 # and they might need to be moved somewhere else
 def format_hex_data(array, element_size):
-    str_format = '0' + str(element_size * 2) + 'x'
-
-    out_str = ''
-
-    i = 0
-    while i < len(array):
-        temp = [array[j] for j in range(i, i + element_size)]
-        element = int.from_bytes(temp, byteorder='little')
-
-        out_str += format(element, str_format) + ' '
-        i += element_size
-
-    return out_str
+    # Read the little endian elements at once and format them in one go.
+    elements = np.frombuffer(array, dtype='<u' + str(element_size))
+    element_format = '%0' + str(element_size * 2) + 'x '
+    return (element_format * len(elements)) % tuple(elements.tolist())
 
 
 def get_bitmap_data(tga):
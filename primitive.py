@@ -1,10 +1,124 @@
-import sys
+import heapq
+import itertools
+from array import array
+import numpy as np
 import bpy
 from .util import *
 from . import local_logger as logger
+from . import profiler
+
+
+class VertexKeys():
+    """
+    Interns the vertices of primitive stores. Every unique combination of
+    position, normal, color, texture coordinate and material gets a small
+    integer id, so strippers can compare vertices with one integer compare.
+    Positions get ids of their own as well.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.position_ids = {}
+
+    def add_store(self, store):
+        keys = np.hstack((
+            store.get_array(store.positions, 3),
+            store.get_array(store.colors, 3),
+            store.get_array(store.normals, 3),
+            store.get_array(store.texcoords, 2),
+            store.get_array(store.materials, 1),
+        )).tolist()
+        ids = self.ids
+        store.keys = array(
+            'q', [ids.setdefault(tuple(x), len(ids)) for x in keys])
+        ids = self.position_ids
+        store.position_keys = array(
+            'q', [ids.setdefault(tuple(x[0:3]), len(ids)) for x in keys])
+
+    def add_primitives(self, prims):
+        """
+        Sets the keys of the stores of the primitives that don't have them
+        yet.
+        """
+        for prim in prims:
+            if prim.store.keys is None:
+                self.add_store(prim.store)
+
+
+class CandidateQueue():
+    """
+    Bucket queue of the primitives that are not processed yet, keyed by the
+    amount of their next candidates that are not processed yet. The counts
+    are updated when a primitive is processed, so picking the next seed
+    doesn't require a scan of every primitive.
+    """
+    def __init__(self, prims, max_candidates):
+        self.prims = prims
+        # Each bucket is a heap of primitive indexes, so the lowest index
+        # is picked first. Entries of primitives that have been processed
+        # or moved to a lower bucket are skipped when peeked.
+        self.buckets = [[] for _ in range(max_candidates + 1)]
+        # The primitives that have a primitive as next candidate.
+        self.referrers = [[] for _ in prims]
+        self.remaining = 0
+        for i, prim in enumerate(prims):
+            for candidate in prim.next_candidates:
+                if candidate != -1:
+                    self.referrers[candidate].append(i)
+        for i, prim in enumerate(prims):
+            if prim.processed:
+                continue
+            self.remaining += 1
+            prim.next_candidate_count = len(
+                [x for x in prim.next_candidates
+                 if x != -1 and not prims[x].processed])
+            self.buckets[prim.next_candidate_count].append(i)
+
+    def set_processed(self, idx):
+        prim = self.prims[idx]
+        if prim.processed:
+            return
+        prim.processed = True
+        self.remaining -= 1
+        for i in self.referrers[idx]:
+            other = self.prims[i]
+            if other.processed or other.next_candidate_count == 0:
+                continue
+            other.next_candidate_count -= 1
+            heapq.heappush(self.buckets[other.next_candidate_count], i)
+
+    def peek_bucket(self, count):
+        bucket = self.buckets[count]
+        while bucket:
+            prim = self.prims[bucket[0]]
+            if not prim.processed and prim.next_candidate_count == count:
+                return bucket[0]
+            heapq.heappop(bucket)
+        return -1
+
+    def get_seed(self):
+        """
+        Returns the index of the primitive to start the next strip with, or
+        -1 when every primitive is processed. This is the first primitive
+        with at most one candidate, otherwise the first primitive with the
+        least candidates.
+        """
+        if self.remaining == 0:
+            return -1
+        seeds = [x for x in (self.peek_bucket(0), self.peek_bucket(1))
+                 if x != -1]
+        if seeds:
+            return min(seeds)
+        for count in range(2, len(self.buckets)):
+            seed = self.peek_bucket(count)
+            if seed != -1:
+                return seed
+        return -1
 
 
 class TriStripper():
+    def __init__(self, vertex_keys=None):
+        self.vertex_keys = VertexKeys() if vertex_keys is None else vertex_keys
+
     def get_previous_tri_edge(self, a, b):
         if b == 0:
             return (2 - (0 if a == 1 else 1), a)
@@ -13,8 +127,9 @@ class TriStripper():
         return (1 if a == 0 else 0, a)
 
     def try_strip_in_direction(self, tris, tri_idx, vtxa, vtxb):
-        processed_tmp = [x.processed for x in tris]
-        processed_tmp[tri_idx] = True
+        # Only the triangles stamped with this generation are visited.
+        self.generation += 1
+        self.visited[tri_idx] = self.generation
         tri = tris[tri_idx]
         vtxb, vtxa = self.get_previous_tri_edge(vtxb, vtxa)
         tri_count = 1
@@ -27,27 +142,28 @@ class TriStripper():
                 if tri.next_candidates[i] == -1:
                     continue
                 candidate = tris[tri.next_candidates[i]]
-                if processed_tmp[tri.next_candidates[i]]:
+                if (candidate.processed or self.visited[
+                        tri.next_candidates[i]] == self.generation):
                     continue
                 if not tri.is_suitable_tstrip_candidate_edge(candidate,
                                                              vtxa,
                                                              vtxb):
                     continue
-                pos_a = tri.positions[vtxa]
+                pos_a = tri.get_position_key(vtxa)
                 vtxa = 0
                 while vtxa < 3:
-                    if candidate.positions[vtxa] == pos_a:
+                    if candidate.get_position_key(vtxa) == pos_a:
                         break
                     vtxa += 1
-                pos_b = tri.positions[vtxb]
+                pos_b = tri.get_position_key(vtxb)
                 vtxb = 0
                 while vtxb < 3:
-                    if candidate.positions[vtxb] == pos_b:
+                    if candidate.get_position_key(vtxb) == pos_b:
                         break
                     vtxb += 1
                 if vtxa != 3 and vtxb != 3:
                     vtxb, vtxa = self.get_previous_tri_edge(vtxb, vtxa)
-                    processed_tmp[tri.next_candidates[i]] = True
+                    self.visited[tri.next_candidates[i]] = self.generation
                     tri_count += 1
                     tri = candidate
                     break
@@ -56,11 +172,10 @@ class TriStripper():
         return tri_count
 
     def make_tstrip_primitive(self, tris, tri_idx, vtxa, vtxb):
-        result = Primitive()
-        result.type = 'triangle_strip'
         tri = tris[tri_idx]
-        tri.processed = True
-        result.material_index = tri.material_index
+        result = Primitive(tri.store, 'triangle_strip', [],
+                           tri.material_index)
+        self.queue.set_processed(tri_idx)
         result.add_vtx(tri, vtxa)
         result.add_vtx(tri, vtxb)
         vtxb, vtxa = self.get_previous_tri_edge(vtxb, vtxa)
@@ -80,65 +195,88 @@ class TriStripper():
                                                              vtxa,
                                                              vtxb):
                     continue
-                pos_a = tri.positions[vtxa]
+                pos_a = tri.get_position_key(vtxa)
                 vtxa = 0
                 while vtxa < 3:
-                    if candidate.positions[vtxa] == pos_a:
+                    if candidate.get_position_key(vtxa) == pos_a:
                         break
                     vtxa += 1
-                pos_b = tri.positions[vtxb]
+                pos_b = tri.get_position_key(vtxb)
                 vtxb = 0
                 while vtxb < 3:
-                    if candidate.positions[vtxb] == pos_b:
+                    if candidate.get_position_key(vtxb) == pos_b:
                         break
                     vtxb += 1
                 if vtxa != 3 and vtxb != 3:
                     vtxb, vtxa = self.get_previous_tri_edge(vtxb, vtxa)
                     result.add_vtx(candidate, vtxb)
-                    candidate.processed = True
+                    self.queue.set_processed(tri.next_candidates[i])
                     tri = candidate
             if i == 3:
                 break
         return result
 
-    def process(self, primitives):
-        result = []
-        tris = [x for x in primitives if x.type == 'triangles']
-        for tri in tris:
-            tri.processed = False
+    def find_candidates(self, tris):
+        """
+        Fill in the next candidates of every triangle. Triangles are only
+        tested against the triangles that share one of their edges, which
+        are found through an index of directed edges. Degenerate
+        triangles can't be indexed by edge, so they are still tested against
+        every triangle. The candidates are tested in index order so the
+        result is the same as testing every pair.
+        """
+        self.vertex_keys.add_primitives(tris)
+        keys = [tri.keys for tri in tris]
+        degenerate = [i for i, key in enumerate(keys) if len(set(key)) < 3]
+
+        # Map each directed edge to the triangles that contain it.
+        edges = {}
+        for i, key in enumerate(keys):
+            if len(set(key)) < 3:
+                continue
+            for j in range(3):
+                edge = (key[j], key[0 if j == 2 else j + 1])
+                edges.setdefault(edge, []).append(i)
 
-        for tri in tris:
+        for tri, key in zip(tris, keys):
             tri.next_candidate_count = 0
             tri.next_candidates = [-1] * 4
-            for i, candidate in enumerate(tris):
-                if not tri.is_suitable_tstrip_candidate(candidate):
+            if len(set(key)) < 3:
+                indexes = range(len(tris))
+            else:
+                indexes = set(degenerate)
+                for j in range(3):
+                    a = key[j]
+                    b = key[0 if j == 2 else j + 1]
+                    indexes.update(edges.get((b, a), []))
+                    # The candidate test also accepts some triangles that
+                    # share the edge in the same direction.
+                    indexes.update(edges.get((a, b), []))
+                indexes = sorted(indexes)
+            for i in indexes:
+                if not tri.is_suitable_tstrip_candidate(tris[i]):
                     continue
                 tri.next_candidates[tri.next_candidate_count] = i
                 tri.next_candidate_count += 1
                 if tri.next_candidate_count >= 3:
                     break
+
+    @profiler.stage('tri_stripper')
+    def process(self, primitives):
+        profiler.count('tri_stripper', len(primitives))
+        result = []
+        tris = [x for x in primitives if x.type == 'triangles']
+        for tri in tris:
+            tri.processed = False
+
+        self.find_candidates(tris)
+        self.queue = CandidateQueue(tris, 3)
+        self.visited = [0] * len(tris)
+        self.generation = 0
         while True:
-            count = 0
-            for tri in tris:
-                if tri.processed:
-                    continue
-                count += 1
-                if tri.next_candidate_count > 0:
-                    cand_count = len([x for x in tri.next_candidates
-                                      if x != -1 and not tris[x].processed])
-                    tri.next_candidate_count = cand_count
-            if count == 0:
+            min_cand_count_idx = self.queue.get_seed()
+            if min_cand_count_idx == -1:
                 break
-            min_cand_count_idx = -1
-            min_cand_count = sys.maxsize
-            for i, tri in enumerate(tris):
-                if tri.processed:
-                    continue
-                if tri.next_candidate_count < min_cand_count:
-                    min_cand_count = tri.next_candidate_count
-                    min_cand_count_idx = i
-                    if min_cand_count <= 1:
-                        break
             max_tris = 0
             max_tris_vtx0 = -1
             max_tris_vtx1 = -1
@@ -153,7 +291,7 @@ class TriStripper():
                     max_tris_vtx1 = vtx1
             if max_tris <= 1:
                 tri = tris[min_cand_count_idx]
-                tri.processed = True
+                self.queue.set_processed(min_cand_count_idx)
                 result.append(tri)
             else:
                 result.append(self.make_tstrip_primitive(tris,
@@ -165,6 +303,12 @@ class TriStripper():
 
 
 class QuadStripper():
+    def __init__(self, vertex_keys=None, validate_candidates=False):
+        self.vertex_keys = VertexKeys() if vertex_keys is None else vertex_keys
+        # When set, the candidates found through the edge index are checked
+        # against the ones found by testing every pair of quads.
+        self.validate_candidates = validate_candidates
+
     def get_opposite_quad_edge(self, a, b):
         if a == 3 and b == 0:
             return (2, 1)
@@ -181,8 +325,9 @@ class QuadStripper():
         )
 
     def try_strip_in_direction(self, quads, quad_idx, vtxa, vtxb):
-        processed_tmp = [x.processed for x in quads]
-        processed_tmp[quad_idx] = True
+        # Only the quads stamped with this generation are visited.
+        self.generation += 1
+        self.visited[quad_idx] = self.generation
         quad = quads[quad_idx]
         vtxa, vtxb = self.get_opposite_quad_edge(vtxa, vtxb)
         quad_count = 1
@@ -195,27 +340,28 @@ class QuadStripper():
                 if quad.next_candidates[i] == -1:
                     continue
                 candidate = quads[quad.next_candidates[i]]
-                if processed_tmp[quad.next_candidates[i]]:
+                if (candidate.processed or self.visited[
+                        quad.next_candidates[i]] == self.generation):
                     continue
                 if not quad.is_suitable_qstrip_candidate_edge(candidate,
                                                               vtxa,
                                                               vtxb):
                     continue
-                pos_a = quad.positions[vtxa]
+                pos_a = quad.get_position_key(vtxa)
                 vtxa = 0
                 while vtxa < 4:
-                    if candidate.positions[vtxa] == pos_a:
+                    if candidate.get_position_key(vtxa) == pos_a:
                         break
                     vtxa += 1
-                pos_b = quad.positions[vtxb]
+                pos_b = quad.get_position_key(vtxb)
                 vtxb = 0
                 while vtxb < 4:
-                    if candidate.positions[vtxb] == pos_b:
+                    if candidate.get_position_key(vtxb) == pos_b:
                         break
                     vtxb += 1
                 if vtxa != 4 and vtxb != 4:
                     vtxa, vtxb = self.get_opposite_quad_edge(vtxa, vtxb)
-                    processed_tmp[quad.next_candidates[i]] = True
+                    self.visited[quad.next_candidates[i]] = self.generation
                     quad_count += 1
                     quad = candidate
                     break
@@ -224,11 +370,10 @@ class QuadStripper():
         return quad_count
 
     def make_qstrip_primitive(self, quads, quad_idx, vtxa, vtxb):
-        result = Primitive()
-        result.type = 'quad_strip'
         quad = quads[quad_idx]
-        quad.processed = True
-        result.material_index = quad.material_index
+        result = Primitive(quad.store, 'quad_strip', [],
+                           quad.material_index)
+        self.queue.set_processed(quad_idx)
         result.add_vtx(quad, vtxa)
         result.add_vtx(quad, vtxb)
         vtxa, vtxb = self.get_opposite_quad_edge(vtxa, vtxb)
@@ -250,23 +395,23 @@ class QuadStripper():
                                                               vtxa,
                                                               vtxb):
                     continue
-                pos_a = quad.positions[vtxa]
+                pos_a = quad.get_position_key(vtxa)
                 vtxa = 0
                 while vtxa < 4:
-                    if candidate.positions[vtxa] == pos_a:
+                    if candidate.get_position_key(vtxa) == pos_a:
                         break
                     vtxa += 1
-                pos_b = quad.positions[vtxb]
+                pos_b = quad.get_position_key(vtxb)
                 vtxb = 0
                 while vtxb < 4:
-                    if candidate.positions[vtxb] == pos_b:
+                    if candidate.get_position_key(vtxb) == pos_b:
                         break
                     vtxb += 1
                 if vtxa != 4 and vtxb != 4:
                     vtxa, vtxb = self.get_opposite_quad_edge(vtxa, vtxb)
                     result.add_vtx(candidate, vtxa)
                     result.add_vtx(candidate, vtxb)
-                    candidate.processed = True
+                    self.queue.set_processed(quad.next_candidates[i])
                     quad_count += 1
                     quad = candidate
                     break
@@ -274,43 +419,101 @@ class QuadStripper():
                 break
         return result
 
-    def process(self, primitives):
-        result = []
-        quads = [x for x in primitives if x.type == 'quads']
-
-        for quad in quads:
+    def find_candidates(self, quads):
+        """
+        Fill in the next candidates of every quad. A quad can only be a
+        candidate when it shares two vertices with the other quad, so quads
+        are only tested against the quads found through an index of vertex
+        pairs. Degenerate quads are still tested against every quad. The
+        candidates are tested in index order so the result is the same as
+        testing every pair.
+        """
+        self.vertex_keys.add_primitives(quads)
+        keys = [quad.keys for quad in quads]
+        degenerate = [i for i, key in enumerate(keys) if len(set(key)) < 4]
+
+        # Map each pair of vertices, including the diagonals, to the quads
+        # that contain it.
+        edges = {}
+        for i, key in enumerate(keys):
+            if len(set(key)) < 4:
+                continue
+            for edge in self.get_quad_vertex_pairs(key):
+                edges.setdefault(edge, []).append(i)
+
+        for quad, key in zip(quads, keys):
             quad.next_candidate_count = 0
             quad.next_candidates = [-1] * 4
-            for i, candidate in enumerate(quads):
-                if not quad.is_suitable_qstrip_candidate(candidate):
+            if len(set(key)) < 4:
+                indexes = range(len(quads))
+            else:
+                indexes = set(degenerate)
+                for edge in self.get_quad_vertex_pairs(key):
+                    indexes.update(edges.get(edge, []))
+                indexes = sorted(indexes)
+            for i in indexes:
+                if not quad.is_suitable_qstrip_candidate(quads[i]):
                     continue
                 quad.next_candidates[quad.next_candidate_count] = i
                 quad.next_candidate_count += 1
                 if quad.next_candidate_count >= 4:
                     break
 
-        while True:
+    def get_quad_vertex_pairs(self, key):
+        pairs = []
+        for i in range(4):
+            for j in range(i + 1, 4):
+                if key[i] < key[j]:
+                    pairs.append((key[i], key[j]))
+                else:
+                    pairs.append((key[j], key[i]))
+        return pairs
+
+    def find_candidates_brute_force(self, quads):
+        """
+        Returns the next candidates of every quad by testing every pair.
+        """
+        result = []
+        for quad in quads:
+            candidates = [-1] * 4
             count = 0
-            for quad in quads:
-                if quad.processed:
+            for i, candidate in enumerate(quads):
+                if not quad.is_suitable_qstrip_candidate(candidate):
                     continue
+                candidates[count] = i
                 count += 1
-                if quad.next_candidate_count > 0:
-                    cand_count = len([x for x in quad.next_candidates
-                                      if x != -1 and not quads[x].processed])
-                    quad.next_candidate_count = cand_count
-            if count == 0:
+                if count >= 4:
+                    break
+            result.append(candidates)
+        return result
+
+    def check_candidates(self, quads):
+        expected = self.find_candidates_brute_force(quads)
+        for i, quad in enumerate(quads):
+            if quad.next_candidates != expected[i]:
+                raise Exception(
+                    f"Quad {i} has candidates {quad.next_candidates}, "
+                    f"expected {expected[i]}")
+        logger.debug("Quad strip candidates of %d quads validated.",
+                     len(quads))
+
+    @profiler.stage('quad_stripper')
+    def process(self, primitives):
+        profiler.count('quad_stripper', len(primitives))
+        result = []
+        quads = [x for x in primitives if x.type == 'quads']
+
+        self.find_candidates(quads)
+        if self.validate_candidates:
+            self.check_candidates(quads)
+
+        self.queue = CandidateQueue(quads, 4)
+        self.visited = [0] * len(quads)
+        self.generation = 0
+        while True:
+            min_cand_count_idx = self.queue.get_seed()
+            if min_cand_count_idx == -1:
                 break
-            min_cand_count_idx = -1
-            min_cand_count = sys.maxsize
-            for i, quad in enumerate(quads):
-                if quad.processed:
-                    continue
-                if quad.next_candidate_count < min_cand_count:
-                    min_cand_count = quad.next_candidate_count
-                    min_cand_count_idx = i
-                    if min_cand_count <= 1:
-                        break
             max_quads = 0
             max_quads_vtx0 = -1
             max_quads_vtx1 = -1
@@ -328,7 +531,7 @@ class QuadStripper():
                     max_quads_vtx1 = vtx1
             if max_quads <= 1:
                 quad = quads[min_cand_count_idx]
-                quad.processed = True
+                self.queue.set_processed(min_cand_count_idx)
                 result.append(quad)
             else:
                 result.append(self.make_qstrip_primitive(quads,
@@ -339,125 +542,319 @@ class QuadStripper():
         return result
 
 
-class Primitive():
+class PrimitiveSorter():
     """
-    Raw representation of blender data into a primitive used
-    for stripping.
+    Orders primitives so that every primitive starts with as much of the
+    state at the end of the previous primitive as possible. The state of
+    a vertex is its group, texture coordinate, color and normal. This is
+    a greedy nearest neighbour walk that starts at the first primitive.
     """
-    def __init__(self, obj=None, polygon=None):
-        if obj is None and polygon is None:
-            self.type = 'illegal'
-            self.positions = []
-            self.normals = []
-            self.colors = []
-            self.texcoords = []
-            self.groups = []
-            self.processed = False
-            self.next_candidate_count = 0
-            # An array of indexes.
-            self.next_candidates = []
-            self.material_index = -1
-            self.vertex_count = 0
-            return
+    # Every subset of the state attributes, the largest first.
+    SUBSETS = [subset for size in range(4, -1, -1)
+               for subset in itertools.combinations(range(4), size)]
+
+    def __init__(self, use_mtx=True, use_tex=True, use_clr=True,
+                 use_nrm=True):
+        self.use_mtx = use_mtx
+        self.use_tex = use_tex
+        self.use_clr = use_clr
+        self.use_nrm = use_nrm
+
+    def get_state(self, store, idx):
+        """
+        Returns the state of a vertex, attributes that are not used are
+        None.
+        """
+        return (
+            store.groups[idx] if self.use_mtx else None,
+            store.get_texcoord(idx) if self.use_tex else None,
+            store.get_color(idx) if self.use_clr else None,
+            store.get_normal(idx) if self.use_nrm else None,
+        )
 
-        self.type = 'illegal'
-        self.positions = []
-        self.normals = []
-        self.colors = []
-        self.texcoords = []
+    def count_state_changes(self, prims):
+        """
+        Counts the state attributes that have to be set when the vertices
+        of the primitives are drawn in this order.
+        """
+        count = 0
+        previous = (None, None, None, None)
+        first = True
+        for prim in prims:
+            for idx in prim.vertices:
+                state = self.get_state(prim.store, idx)
+                for i in range(4):
+                    if state[i] is None:
+                        continue
+                    # A normal is set again after the matrix changes.
+                    if (first or state[i] != previous[i]
+                       or i == 3 and state[0] != previous[0]):
+                        count += 1
+                previous = state
+                first = False
+        return count
+
+    def process(self, prims):
+        if len(prims) < 3:
+            return prims
+        starts = [self.get_state(prim.store, prim.vertices[0])
+                  for prim in prims]
+        ends = [self.get_state(prim.store, prim.vertices[-1])
+                for prim in prims]
+
+        # For every subset, the primitives by the attributes of their first
+        # vertex. The lists are reversed so the lowest index is at the end.
+        buckets = [{} for _ in self.SUBSETS]
+        for idx in range(len(prims) - 1, -1, -1):
+            for subset, bucket in zip(self.SUBSETS, buckets):
+                key = tuple(starts[idx][i] for i in subset)
+                bucket.setdefault(key, []).append(idx)
+
+        used = [False] * len(prims)
+        used[0] = True
+        order = [0]
+        for _ in range(len(prims) - 1):
+            end = ends[order[-1]]
+            best = None
+            size = 4
+            for subset, bucket in zip(self.SUBSETS, buckets):
+                if len(subset) < size:
+                    if best is not None:
+                        break
+                    size = len(subset)
+                candidates = bucket.get(tuple(end[i] for i in subset))
+                while candidates and used[candidates[-1]]:
+                    candidates.pop()
+                if candidates and (best is None or candidates[-1] < best):
+                    best = candidates[-1]
+            used[best] = True
+            order.append(best)
+        return [prims[idx] for idx in order]
+
+
+class MeshData():
+    """
+    The vertex and loop attributes of a mesh, read in one pass per
+    attribute with foreach_get instead of per loop. Positions and texture
+    coordinates are stored in FX32 and normals in FX10.
+    """
+    def __init__(self, obj):
+        mesh = obj.data
+        vertex_count = len(mesh.vertices)
+        loop_count = len(mesh.loops)
+
+        positions = np.empty(vertex_count * 3, dtype=np.float64)
+        mesh.vertices.foreach_get('co', positions)
+        self.positions = floats_to_fx32(positions.reshape(-1, 3))
+
+        self.loop_vertices = np.empty(loop_count, dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', self.loop_vertices)
+
+        normals = np.empty(loop_count * 3, dtype=np.float32)
+        mesh.loops.foreach_get('normal', normals)
+        normals = normalize_vectors(normals.reshape(-1, 3))
+        self.normals = floats_to_fx10(normals)
+
+        # The first group of every vertex, or -1.
+        self.groups = np.array(
+            [v.groups[0].group if v.groups else -1 for v in mesh.vertices],
+            dtype=np.int32)
+
+        # The vertex colors may not be aligned with the vertex loops, loops
+        # without a color get black, see get_color_from_obj.
+        self.colors = None
+        if len(mesh.vertex_colors) > 0:
+            data = mesh.vertex_colors[0].data
+            colors = np.empty(len(data) * 4, dtype=np.float64)
+            data.foreach_get('color', colors)
+            colors = colors.reshape(-1, 4)[:loop_count, :3]
+            self.colors = np.zeros((loop_count, 3), dtype=np.int32)
+            self.colors[:len(colors)] = np.rint(colors * 31)
+
+        # The uv layer may not be aligned either, uv_count holds the amount
+        # of loops that have a texture coordinate.
+        self.uv_layer = mesh.uv_layers.active
+        self.uvs = None
+        self.uv_count = 0
+        if self.uv_layer is not None:
+            data = self.uv_layer.data
+            uvs = np.empty(len(data) * 2, dtype=np.float64)
+            data.foreach_get('uv', uvs)
+            self.uvs = floats_to_fx32(uvs.reshape(-1, 2))
+            self.uv_count = len(data)
+
+
+class PrimitiveStore():
+    """
+    The vertices of the primitives of a mesh, stored as a struct of typed
+    arrays with one entry for every loop of the mesh. Primitives only hold
+    the indexes of their vertices in the store.
+    """
+    def __init__(self, mesh_data):
+        loop_count = len(mesh_data.loop_vertices)
+        loop_vertices = mesh_data.loop_vertices
+
+        # Positions and texture coordinates are in FX32, normals in FX10.
+        self.positions = self.make_array(mesh_data.positions[loop_vertices])
+        self.normals = self.make_array(mesh_data.normals)
+        if mesh_data.colors is not None:
+            self.colors = self.make_array(mesh_data.colors)
+        else:
+            self.colors = array('q', bytes(loop_count * 3 * 8))
+        texcoords = np.zeros((loop_count, 2), dtype=np.int64)
+        if mesh_data.uvs is not None:
+            uvs = mesh_data.uvs[:loop_count]
+            texcoords[:len(uvs)] = uvs
+        self.texcoords = self.make_array(texcoords)
         # The group this vertex belongs to.
         # This is not important for stripping.
-        self.groups = []
-        self.processed = False
-        self.next_candidate_count = 0
-        # An array of indexes.
-        self.next_candidates = []
+        self.groups = self.make_array(mesh_data.groups[loop_vertices])
+        self.materials = array('q', [-1]) * loop_count
+
+        self.uv_layer = mesh_data.uv_layer
+        self.uv_count = mesh_data.uv_count
+
+        # Set by VertexKeys.
+        self.keys = None
+        self.position_keys = None
+
+    def make_array(self, values):
+        return array('q', np.ascontiguousarray(values, dtype=np.int64)
+                     .tobytes())
+
+    def get_array(self, values, size):
+        """
+        Returns a NumPy view of one of the arrays of the store without
+        copying it.
+        """
+        return np.frombuffer(values, dtype=np.int64).reshape(-1, size)
+
+    def add_polygon(self, polygon, material_index):
+        result = Primitive(self, 'illegal', list(polygon.loop_indices),
+                           material_index)
+        if len(result.vertices) == 3:
+            result.type = 'triangles'
+        elif len(result.vertices) == 4:
+            result.type = 'quads'
+        for idx in result.vertices:
+            self.materials[idx] = material_index
+            if self.uv_layer is not None and self.uv_count <= idx:
+                logger.log_repeated(
+                    f'Object uv layer not aligned, add zero coord: '
+                    f'{self.uv_layer.name}', logger.WARNING)
+        return result
 
-        self.material_index = get_global_mat_index(
-            obj, polygon.material_index)
+    def get_position(self, idx):
+        i = idx * 3
+        return (self.positions[i], self.positions[i + 1],
+                self.positions[i + 2])
 
-        vertices = [v.co for v in obj.data.vertices.values()]
+    def set_position(self, idx, position):
+        i = idx * 3
+        self.positions[i:i + 3] = array('q', position)
 
-        if len(polygon.loop_indices) == 3:
-            self.type = 'triangles'
-            self.vertex_count = 3
-        elif len(polygon.loop_indices) == 4:
-            self.type = 'quads'
-            self.vertex_count = 4
+    def get_normal(self, idx):
+        i = idx * 3
+        return (self.normals[i], self.normals[i + 1], self.normals[i + 2])
 
-        use_colors = False
+    def set_normal(self, idx, normal):
+        i = idx * 3
+        self.normals[i:i + 3] = array('q', normal)
 
-        if len(obj.data.vertex_colors) > 0:
-            use_colors = True
+    def get_color(self, idx):
+        i = idx * 3
+        return (self.colors[i], self.colors[i + 1], self.colors[i + 2])
 
-        for idx in polygon.loop_indices:
-            # Get vertex and convert it to VecFx32.
-            vertex_index = obj.data.loops[idx].vertex_index
-            vecfx32 = VecFx32().from_floats(vertices[vertex_index])
+    def get_texcoord(self, idx):
+        i = idx * 2
+        return (self.texcoords[i], self.texcoords[i + 1])
 
-            # Store position.
-            self.positions.append(vecfx32)
 
-            # Store group.
-            groups = obj.data.vertices[vertex_index].groups
-            if groups:
-                self.groups.append(groups[0].group)
-            else:
-                self.groups.append(-1)
-
-            # Color
-            if use_colors:
-                # Use special function to get color because the vertex colors
-                # may not align with the vertex loops.
-                color = get_color_from_obj(obj, idx)
-                r = int(round(color[0] * 31))
-                g = int(round(color[1] * 31))
-                b = int(round(color[2] * 31))
-                self.colors.append((r, g, b))
-            else:
-                self.colors.append((0, 0, 0))
-
-            # Normal
-            normal = obj.data.loops[idx].normal
-            self.normals.append(vector_to_vecfx10(normal.normalized()))
-
-            # Texture coordinates
-            if obj.data.uv_layers.active is not None:
-                if len(obj.data.uv_layers.active.data) <= idx:
-                    logger.log('Object uv layer not aligned, add zero coord:')
-                    logger.log(f'UV layer: {obj.data.uv_layers.active.name}')
-                    self.texcoords.append(VecFx32([0, 0, 0]))
-                else:
-                    uv = obj.data.uv_layers.active.data[idx].uv
-                    self.texcoords.append(
-                        VecFx32().from_vector(Vector([uv[0], uv[1], 0])))
-            else:
-                self.texcoords.append(VecFx32([0, 0, 0]))
+class Primitive():
+    """
+    Primitive used for stripping. The vertices are indexes of vertices in
+    a PrimitiveStore.
+    """
+    __slots__ = (
+        'store',
+        'type',
+        'vertices',
+        'material_index',
+        'processed',
+        'next_candidate_count',
+        # An array of indexes.
+        'next_candidates',
+    )
+
+    def __init__(self, store, type_='illegal', vertices=None,
+                 material_index=-1):
+        self.store = store
+        self.type = type_
+        self.vertices = [] if vertices is None else vertices
+        self.material_index = material_index
+        self.processed = False
+        self.next_candidate_count = 0
+        self.next_candidates = []
+
+    @property
+    def vertex_count(self):
+        return len(self.vertices)
+
+    @property
+    def keys(self):
+        keys = self.store.keys
+        return [keys[x] for x in self.vertices]
 
     def add_vtx(self, src, idx):
-        self.vertex_count += 1
-        self.positions.append(src.positions[idx])
-        self.colors.append(src.colors[idx])
-        self.normals.append(src.normals[idx])
-        self.texcoords.append(src.texcoords[idx])
-        self.groups.append(src.groups[idx])
-
-    def is_extra_data_equal(self, a, other, b):
-        return (
-            self.colors[a] == other.colors[b]
-            and self.material_index == other.material_index
-            and self.normals[a] == other.normals[b]
-            and self.texcoords[a] == other.texcoords[b]
-        )
+        self.vertices.append(src.vertices[idx])
+
+    def get_position_key(self, idx):
+        return self.store.position_keys[self.vertices[idx]]
+
+    def get_groups(self):
+        groups = self.store.groups
+        return [groups[x] for x in self.vertices]
+
+    def split(self, keys, limit):
+        """
+        Splits a strip into strips that each have at most limit different
+        keys, keys has a key for every vertex. Strips are split at an even
+        vertex, so triangle strips keep their winding and quad strips
+        whole quads. limit must be at least 4, so every strip has a polygon.
+        """
+        if limit < 4:
+            raise Exception(f"Can't split strips to {limit} matrices, at "
+                            f"least 4 are needed.")
+        if len(set(keys)) <= limit or self.type not in [
+                'triangle_strip', 'quad_strip']:
+            return [self]
+        min_size = 3 if self.type == 'triangle_strip' else 4
+        result = []
+        start = 0
+        while start + min_size <= len(keys):
+            end = start
+            used = set()
+            while end < len(keys) and len(used | {keys[end]}) <= limit:
+                used.add(keys[end])
+                end += 1
+            if end < len(keys):
+                end -= (end - start) % 2
+            result.append(Primitive(self.store, self.type,
+                                    self.vertices[start:end],
+                                    self.material_index))
+            # The last edge is shared with the next strip.
+            start = end - 2
+        return result
 
     def is_suitable_tstrip_candidate(self, candidate):
+        keys = self.store.keys
         equal_count = 0
         first_i = 0
         first_j = 0
         for i in range(3):
             for j in range(3):
-                if (self.positions[i] != candidate.positions[j]
-                        or not self.is_extra_data_equal(i, candidate, j)):
+                if (keys[self.vertices[i]]
+                        != keys[candidate.vertices[j]]):
                     continue
                 if equal_count == 0:
                     first_i = i
@@ -470,24 +867,26 @@ class Primitive():
         return False
 
     def is_suitable_tstrip_candidate_edge(self, candidate, a, b):
+        keys = self.store.keys
+        key_a = keys[self.vertices[a]]
+        key_b = keys[self.vertices[b]]
         equal_count = 0
         for i in range(3):
-            if (self.positions[a] == candidate.positions[i]
-                    and self.is_extra_data_equal(a, candidate, i)):
+            if key_a == keys[candidate.vertices[i]]:
                 equal_count += 1
-            if (self.positions[b] == candidate.positions[i]
-                    and self.is_extra_data_equal(b, candidate, i)):
+            if key_b == keys[candidate.vertices[i]]:
                 equal_count += 1
         return equal_count == 2
 
     def is_suitable_qstrip_candidate(self, candidate):
+        keys = self.store.keys
         equal_count = 0
         first_i = 0
         first_j = 0
         for i in range(4):
             for j in range(4):
-                if (self.positions[i] != candidate.positions[j]
-                        or not self.is_extra_data_equal(i, candidate, j)):
+                if (keys[self.vertices[i]]
+                        != keys[candidate.vertices[j]]):
                     continue
                 if equal_count == 0:
                     first_i = i
@@ -500,12 +899,13 @@ class Primitive():
         return False
 
     def is_suitable_qstrip_candidate_edge(self, candidate, a, b):
+        keys = self.store.keys
+        key_a = keys[self.vertices[a]]
+        key_b = keys[self.vertices[b]]
         equal_count = 0
         for i in range(4):
-            if (self.positions[a] == candidate.positions[i]
-                    and self.is_extra_data_equal(a, candidate, i)):
+            if key_a == keys[candidate.vertices[i]]:
                 equal_count += 1
-            if (self.positions[b] == candidate.positions[i]
-                    and self.is_extra_data_equal(b, candidate, i)):
+            if key_b == keys[candidate.vertices[i]]:
                 equal_count += 1
         return equal_count == 2
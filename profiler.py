@@ -0,0 +1,128 @@
+import csv
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+
+_enabled = False
+
+
+_profile = None
+
+
+# Statistics of every stage by name, in the order the stages first ran.
+_stages = {}
+
+
+# Peak memory of the stages that are running on this thread.
+_local = threading.local()
+
+
+_lock = threading.Lock()
+
+
+def start_profile(enabled, use_cprofile=False):
+    """
+    Starts recording the stages of the export. Memory is traced with
+    tracemalloc, and use_cprofile also runs cProfile.
+    """
+    global _enabled, _profile
+    _enabled = enabled
+    _stages.clear()
+    if not enabled:
+        return
+    tracemalloc.start()
+    if use_cprofile:
+        _profile = cProfile.Profile()
+        _profile.enable()
+
+
+def stop_profile(filepath):
+    """
+    Stops recording and writes the profile to filepath.profile.json and
+    filepath.profile.csv, and the cProfile dump to filepath.prof.
+    """
+    global _enabled, _profile
+    if not _enabled:
+        return
+    _enabled = False
+    tracemalloc.stop()
+    if _profile is not None:
+        _profile.disable()
+        _profile.dump_stats(filepath + '.prof')
+        _profile = None
+
+    rows = []
+    for name, stats in _stages.items():
+        rows.append(dict(stage=name, **stats))
+        rows[-1]['seconds'] = round(stats['seconds'], 6)
+    with open(filepath + '.profile.json', 'w') as f:
+        json.dump(rows, f, indent=4)
+    with open(filepath + '.profile.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, ['stage', 'calls', 'seconds',
+                                    'peak_memory', 'elements'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def get_stats(name):
+    if name not in _stages:
+        _stages[name] = {
+            'calls': 0,
+            'seconds': 0.0,
+            'peak_memory': 0,
+            'elements': 0,
+        }
+    return _stages[name]
+
+
+@contextmanager
+def stage(name):
+    """
+    Records the wall time and the peak memory above the memory at the
+    start of the stage. Stages can be nested and run on several threads,
+    the peak memory is shared by the threads though.
+    """
+    if not _enabled:
+        yield
+        return
+    # Every running stage has its memory at the start and its peak so far.
+    peaks = getattr(_local, 'peaks', None)
+    if peaks is None:
+        peaks = _local.peaks = []
+    current, peak = tracemalloc.get_traced_memory()
+    if peaks:
+        peaks[-1][1] = max(peaks[-1][1], peak)
+    # Not available before Python 3.9, the peak is then the peak since the
+    # profile started.
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    peaks.append([current, current])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        current, peak = peaks.pop()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        if peaks:
+            peaks[-1][1] = max(peaks[-1][1], peak)
+        with _lock:
+            stats = get_stats(name)
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['peak_memory'] = max(stats['peak_memory'], peak - current)
+
+
+def count(name, elements):
+    """
+    Adds to the number of elements, like primitives or vertices, that
+    stage name handled.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        get_stats(name)['elements'] += elements
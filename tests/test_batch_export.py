@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import stat
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import batch_export
+
+
+# Stands in for Blender: writes the files of the output given after '--'
+# and fails for blend files with 'broken' in the name.
+FAKE_BLENDER = '''#!{python}
+import os, sys, json
+blend = sys.argv[2]
+args = sys.argv[sys.argv.index('--') + 1:]
+output = args[args.index('--output') + 1]
+settings = json.loads(args[args.index('--settings') + 1])
+if 'broken' in blend:
+    print('Error: could not export ' + blend)
+    sys.exit(1)
+stem = os.path.splitext(output)[0]
+for extension in settings.get('write', ['imd']):
+    with open(stem + '.' + extension, 'w') as f:
+        f.write(extension * 10)
+'''
+
+
+def write_manifest(tmp_path, manifest):
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+@pytest.fixture
+def fake_blender(tmp_path):
+    path = tmp_path / 'blender'
+    path.write_text(FAKE_BLENDER.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_parse_args():
+    args = batch_export.parse_args(['m.json', '--jobs', '2',
+                                    '--summary', 's.json'])
+    assert (args.manifest, args.jobs, args.summary) == ('m.json', 2,
+                                                       's.json')
+    assert not args.worker
+    args = batch_export.parse_args(['--worker', '--output', 'a',
+                                    '--settings', '{}'])
+    assert args.worker and args.manifest is None
+
+
+def test_parse_args_requires_a_manifest():
+    with pytest.raises(SystemExit):
+        batch_export.parse_args(['--jobs', '2'])
+
+
+def test_read_manifest(tmp_path):
+    path = write_manifest(tmp_path, {
+        'settings': {'imd_compress_nodes': 'cull', 'ica_export': False},
+        'files': [
+            {'blend': 'a.blend', 'output': 'out/a.imd'},
+            {'blend': 'sub/b.blend', 'settings': {'ica_export': True}},
+        ],
+    })
+    a, b = batch_export.read_manifest(path)
+    assert a == {
+        'blend': str(tmp_path / 'a.blend'),
+        'output': str(tmp_path / 'out' / 'a.imd'),
+        'settings': {'imd_compress_nodes': 'cull', 'ica_export': False},
+    }
+    # The output is the blend file without extension by default, and the
+    # settings of a file override those of the manifest.
+    assert b == {
+        'blend': str(tmp_path / 'sub' / 'b.blend'),
+        'output': str(tmp_path / 'sub' / 'b'),
+        'settings': {'imd_compress_nodes': 'cull', 'ica_export': True},
+    }
+
+
+def test_read_manifest_without_settings(tmp_path):
+    path = write_manifest(tmp_path, {'files': [{'blend': 'a.blend'}]})
+    assert batch_export.read_manifest(path)[0]['settings'] == {}
+
+
+def test_run_job(tmp_path, fake_blender):
+    job = {'blend': str(tmp_path / 'a.blend'), 'output': str(tmp_path / 'a'),
+           'settings': {'write': ['imd', 'ica']}}
+    result = batch_export.run_job(fake_blender, job)
+    assert result['success']
+    assert result['sizes'] == {'imd': 30, 'ica': 30}
+
+
+def test_run_job_leaves_out_old_files(tmp_path, fake_blender):
+    (tmp_path / 'a.ica').write_text('old')
+    (tmp_path / 'b.imd').write_text('old')
+    job = {'blend': str(tmp_path / 'a.blend'), 'output': str(tmp_path / 'a'),
+           'settings': {'write': ['imd']}}
+    assert batch_export.run_job(fake_blender, job)['sizes'] == {'imd': 30}
+    job = {'blend': str(tmp_path / 'broken.blend'),
+           'output': str(tmp_path / 'b'), 'settings': {}}
+    result = batch_export.run_job(fake_blender, job)
+    assert not result['success'] and result['sizes'] == {}
+    assert 'could not export' in result['error']
+
+
+@pytest.mark.parametrize('blender', ['', 'missing-blender-binary'])
+def test_run_job_without_blender(tmp_path, blender):
+    job = {'blend': str(tmp_path / 'a.blend'), 'output': str(tmp_path / 'a'),
+           'settings': {}}
+    result = batch_export.run_job(blender, job)
+    assert not result['success']
+    assert result['error'].startswith(f"Could not run {blender!r}")
+
+
+def test_run_batch(tmp_path, fake_blender, capsys):
+    manifest = write_manifest(tmp_path, {
+        'files': [{'blend': 'a.blend'}, {'blend': 'broken.blend'}],
+    })
+    summary = str(tmp_path / 'summary.json')
+    args = batch_export.parse_args([manifest, '--blender', fake_blender,
+                                    '--summary', summary, '--jobs', '2'])
+    assert batch_export.run_batch(args) == 1
+    assert 'Exported 1 of 2 files, 1 failed.' in capsys.readouterr().out
+    with open(summary) as f:
+        results = json.load(f)
+    assert [r['success'] for r in results] == [True, False]
+
+
+def test_run_batch_without_blender(tmp_path, capsys):
+    manifest = write_manifest(tmp_path, {'files': [{'blend': 'a.blend'}]})
+    summary = str(tmp_path / 'summary.json')
+    args = batch_export.parse_args([manifest, '--blender', '',
+                                    '--summary', summary])
+    assert batch_export.run_batch(args) == 1
+    assert 'Exported 0 of 1 files, 1 failed.' in capsys.readouterr().out
+    assert os.path.exists(summary)
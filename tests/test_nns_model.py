@@ -0,0 +1,38 @@
+import os
+import sys
+import importlib
+import pytest
+
+# nns_model needs Blender's modules, they are available in Blender or with
+# the bpy module from PyPI.
+pytest.importorskip('bpy')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(ROOT))
+nns_model = importlib.import_module(os.path.basename(ROOT) + '.nns_model')
+
+
+def test_partition_matrix_sets_fits_the_limit():
+    matrix_sets = [{i, i + 1, i + 2} for i in range(0, 40, 2)]
+    groups = nns_model.partition_matrix_sets(matrix_sets, 5)
+    assert sorted(idx for group in groups for idx in group) == \
+        list(range(len(matrix_sets)))
+    for group in groups:
+        assert len(set().union(*[matrix_sets[idx] for idx in group])) <= 5
+
+
+def test_partition_matrix_sets_rejects_oversized_sets():
+    matrix_sets = [{0, 1}, {0, 1, 2, 3, 4}, {2, 3}]
+    with pytest.raises(Exception, match='more than the limit of 4'):
+        nns_model.partition_matrix_sets(matrix_sets, 4)
+
+
+@pytest.mark.parametrize('limit', [0, 3, 32])
+def test_collect_rejects_invalid_matrix_limits(limit):
+    model = nns_model.NitroModel({
+        'imd_mtx_list_size': limit,
+        'imd_compress_nodes': 'none',
+        'texture_cache_dir': '',
+    })
+    with pytest.raises(Exception, match='between 4 and 31'):
+        model.collect()
@@ -0,0 +1,62 @@
+import os
+import sys
+import struct
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nns_tga
+
+
+def make_chunk(sig, data=b'', length=None):
+    if length is None:
+        length = len(data) + nns_tga.NITRO_TGA_CHUNK.size
+    return nns_tga.NITRO_TGA_CHUNK.pack(sig.encode('ascii'), length) + data
+
+
+def write_tga(path, chunks):
+    header = nns_tga.TGA_HEADER.pack(20, 0, 2, 0, 0, 0, 0, 0, 2, 2, 32, 8)
+    pixels = bytes(16)
+    offset = len(header) + nns_tga.NITRO_TGA_ID.size + len(pixels)
+    nitro_id = nns_tga.NITRO_TGA_ID.pack(b'NNS_Tga Ver 1.0', offset)
+    path.write_bytes(header + nitro_id + pixels + b''.join(chunks))
+    return str(path)
+
+
+def test_read_nitro_tga(tmp_path):
+    path = write_tga(tmp_path / 'a.tga', [
+        make_chunk('nns_frmt', b'direct'),
+        make_chunk('nns_txel', struct.pack('<4H', 1, 2, 3, 0x8000)),
+        make_chunk('nns_endb'),
+    ])
+    with nns_tga.read_nitro_tga(path) as tga:
+        assert tga['header']['image_width'] == 2
+        assert tga['nitro_data']['tex_format'] == 'direct'
+        assert nns_tga.get_bitmap_data(tga) == '0001 0002 0003 8000 '
+        texel_data = tga['nitro_data']['texel_data']
+    # The views are released when the with block ends.
+    with pytest.raises(ValueError):
+        bytes(texel_data)
+
+
+@pytest.mark.parametrize('length', [0, 11, 1 << 20])
+def test_read_nitro_tga_rejects_invalid_chunk_lengths(tmp_path, length):
+    path = write_tga(tmp_path / 'a.tga', [
+        make_chunk('nns_frmt', b'direct'),
+        make_chunk('nns_txel', bytes(8), length),
+        make_chunk('nns_endb'),
+    ])
+    with pytest.raises(Exception, match='nns_txel .* invalid length'):
+        with nns_tga.read_nitro_tga(path):
+            pass
+
+
+def test_read_nitro_tga_keeps_errors_of_the_with_block(tmp_path):
+    path = write_tga(tmp_path / 'a.tga', [
+        make_chunk('nns_txel', bytes(8)),
+        make_chunk('nns_endb'),
+    ])
+    with pytest.raises(KeyError):
+        with nns_tga.read_nitro_tga(path) as tga:
+            texels = np.frombuffer(tga['nitro_data']['texel_data'])
+            raise KeyError(len(texels))
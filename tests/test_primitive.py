@@ -0,0 +1,105 @@
+import os
+import sys
+import random
+import importlib
+import pytest
+
+# primitive needs Blender's modules, they are available in Blender or with
+# the bpy module from PyPI.
+bpy = pytest.importorskip('bpy')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(ROOT))
+primitive = importlib.import_module(os.path.basename(ROOT) + '.primitive')
+
+
+def make_grid(size, triangulate, seed=0):
+    """
+    Returns the primitives of a flat grid of size by size quads, split in
+    triangles if triangulate is set. The faces are shuffled.
+    """
+    vertices = [(x, y, 0) for y in range(size + 1) for x in range(size + 1)]
+    faces = []
+    for y in range(size):
+        for x in range(size):
+            a = y * (size + 1) + x
+            quad = (a, a + 1, a + size + 2, a + size + 1)
+            if triangulate:
+                faces.append((quad[0], quad[1], quad[2]))
+                faces.append((quad[0], quad[2], quad[3]))
+            else:
+                faces.append(quad)
+    random.Random(seed).shuffle(faces)
+    mesh = bpy.data.meshes.new('grid')
+    mesh.from_pydata(vertices, [], faces)
+    obj = bpy.data.objects.new('grid', mesh)
+    store = primitive.PrimitiveStore(primitive.MeshData(obj))
+    return [store.add_polygon(polygon, 0) for polygon in mesh.polygons]
+
+
+def get_triangles(prims):
+    """
+    Returns the positions of every triangle of the primitives.
+    """
+    result = []
+    for prim in prims:
+        v = [prim.store.get_position(idx) for idx in prim.vertices]
+        if prim.type == 'triangles':
+            result.append(frozenset(v))
+        elif prim.type == 'triangle_strip':
+            result.extend(frozenset(v[i:i + 3]) for i in range(len(v) - 2))
+    return result
+
+
+def get_quads(prims):
+    """
+    Returns the positions of every quad of the primitives.
+    """
+    result = []
+    for prim in prims:
+        v = [prim.store.get_position(idx) for idx in prim.vertices]
+        if prim.type == 'quads':
+            result.append(frozenset(v))
+        elif prim.type == 'quad_strip':
+            result.extend(frozenset(v[i:i + 4])
+                          for i in range(0, len(v) - 2, 2))
+    return result
+
+
+@pytest.mark.parametrize('size, strips', [(10, 84), (30, 747)])
+def test_tri_stripper_grid(size, strips):
+    prims = make_grid(size, True)
+    expected = sorted(get_triangles(prims), key=sorted)
+    result = primitive.TriStripper(primitive.VertexKeys()).process(prims)
+    assert len(result) == strips
+    assert sorted(get_triangles(result), key=sorted) == expected
+
+
+@pytest.mark.parametrize('size, strips', [(10, 10), (30, 30)])
+def test_quad_stripper_grid(size, strips):
+    prims = make_grid(size, False)
+    expected = sorted(get_quads(prims), key=sorted)
+    result = primitive.QuadStripper(primitive.VertexKeys()).process(prims)
+    assert len(result) == strips
+    assert sorted(get_quads(result), key=sorted) == expected
+
+
+def make_strip(type_, count):
+    return primitive.Primitive(None, type_, list(range(count)), 0)
+
+
+@pytest.mark.parametrize('type_', ['triangle_strip', 'quad_strip'])
+def test_split_keeps_every_piece_under_the_limit(type_):
+    strip = make_strip(type_, 40)
+    keys = list(range(40))
+    pieces = strip.split(keys, 4)
+    assert all(len(set(keys[v] for v in piece.vertices)) <= 4
+               for piece in pieces)
+    assert pieces[0].vertices[0] == 0 and pieces[-1].vertices[-1] == 39
+
+
+@pytest.mark.parametrize('type_', ['triangle_strip', 'quad_strip'])
+@pytest.mark.parametrize('limit', [0, 1, 2, 3])
+def test_split_rejects_small_limits(type_, limit):
+    with pytest.raises(Exception, match='at least 4'):
+        make_strip(type_, 40).split(list(range(40)), limit)
@@ -0,0 +1,75 @@
+import os
+import sys
+import importlib
+import pytest
+
+# The add-on package needs Blender's modules, they are available in Blender
+# or with the bpy module from PyPI.
+pytest.importorskip('bpy')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(ROOT))
+texture_cache = importlib.import_module(
+    os.path.basename(ROOT) + '.texture_cache')
+
+
+class Converter():
+    def __init__(self):
+        self.paths = []
+
+    def __call__(self, path):
+        self.paths.append(path)
+        with open(path, 'rb') as f:
+            return {'size': len(f.read())}
+
+
+def make_cache(tmp_path, monkeypatch):
+    cache = texture_cache.TextureCache(str(tmp_path / 'cache'), 1 << 20)
+    hashed = []
+    get_content_key = cache.get_content_key
+
+    def counting(path):
+        hashed.append(path)
+        return get_content_key(path)
+    monkeypatch.setattr(cache, 'get_content_key', counting)
+    return cache, hashed
+
+
+def test_hits_do_not_hash_the_texture(tmp_path, monkeypatch):
+    texture = tmp_path / 'a.tga'
+    texture.write_bytes(b'a' * 100)
+    cache, hashed = make_cache(tmp_path, monkeypatch)
+    convert = Converter()
+    assert cache.load(str(texture), convert) == {'size': 100}
+    assert cache.load(str(texture), convert) == {'size': 100}
+    assert len(convert.paths) == 1 and len(hashed) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changed_textures_are_hashed_again(tmp_path, monkeypatch):
+    texture = tmp_path / 'a.tga'
+    texture.write_bytes(b'a' * 100)
+    cache, hashed = make_cache(tmp_path, monkeypatch)
+    convert = Converter()
+    cache.load(str(texture), convert)
+    # Same content, newer modification time: the entry is found by content.
+    os.utime(texture, ns=(1, 10 ** 18))
+    assert cache.load(str(texture), convert) == {'size': 100}
+    assert len(convert.paths) == 1 and len(hashed) == 2
+    # New content is converted again.
+    texture.write_bytes(b'b' * 50)
+    assert cache.load(str(texture), convert) == {'size': 50}
+    assert len(convert.paths) == 2 and len(hashed) == 3
+
+
+def test_evicts_least_recently_used_files(tmp_path):
+    cache = texture_cache.TextureCache(str(tmp_path / 'cache'), 200)
+    for i in range(10):
+        texture = tmp_path / f'{i}.tga'
+        texture.write_bytes(bytes([i]) * 1000)
+        cache.load(str(texture), lambda path: {'data': 'x' * 100})
+    names = os.listdir(cache.directory)
+    sizes = [os.path.getsize(os.path.join(cache.directory, name))
+             for name in names]
+    assert sum(sizes) <= 200
+    assert not [name for name in names if name.endswith('.tmp')]
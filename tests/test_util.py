@@ -0,0 +1,107 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# util needs Blender's modules, they are available in Blender or with the
+# bpy module from PyPI.
+pytest.importorskip('bpy')
+from mathutils import Matrix, Quaternion, Vector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import util
+
+
+def random_vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, 3)) * rng.uniform(0.5, 2, (count, 1))
+    return vectors.astype(np.float32)
+
+
+def test_normalize_vectors_like_vector_normalized():
+    vectors = random_vectors(20000)
+    vectors[:100] = np.round(vectors[:100], 1)
+    vectors[100] = 0
+    vectors[101] = [1e-20, 0, 0]
+    expected = np.array([Vector(v).normalized() for v in vectors.tolist()],
+                        dtype=np.float32)
+    np.testing.assert_array_equal(util.normalize_vectors(vectors), expected)
+
+
+def test_normalized_normals_to_fx10_like_scalar_path():
+    vectors = random_vectors(20000, seed=1)
+    expected = [util.vector_to_vecfx10(Vector(v).normalized())
+                for v in vectors.tolist()]
+    expected = np.array([[v.x, v.y, v.z] for v in expected])
+    result = util.floats_to_fx10(util.normalize_vectors(vectors))
+    np.testing.assert_array_equal(result, expected)
+
+
+def scalar_fx32(values):
+    return np.array([util.float_to_fx32(v) for v in values.tolist()])
+
+
+def scalar_fx10(values):
+    return np.array([util.float_to_fx10(v) for v in values.tolist()])
+
+
+def test_floats_to_fx32_rounds_ties_like_float_to_fx32():
+    values = (np.arange(-64, 64) + 0.5) / 4096
+    np.testing.assert_array_equal(util.floats_to_fx32(values),
+                                  scalar_fx32(values))
+
+
+def test_floats_to_fx32_like_float_to_fx32():
+    rng = np.random.default_rng(2)
+    values = rng.uniform(-1000, 1000, 20000)
+    for dtype in (np.float64, np.float32):
+        array = values.astype(dtype)
+        np.testing.assert_array_equal(util.floats_to_fx32(array),
+                                      scalar_fx32(array))
+    values = values.reshape(-1, 2)
+    np.testing.assert_array_equal(util.floats_to_fx32(values),
+                                  scalar_fx32(values.ravel()).reshape(-1, 2))
+
+
+def test_floats_to_fx10_rounds_ties_like_float_to_fx10():
+    values = (np.arange(-520, 520) + 0.5) / 512
+    np.testing.assert_array_equal(util.floats_to_fx10(values),
+                                  scalar_fx10(values))
+
+
+def test_floats_to_fx10_clamps_like_float_to_fx10():
+    values = np.array([-2.0, -1.0, -1.0009765625, -0.9990234375,
+                       0.998046875, 0.9990234375, 0.999, 1.0, 2.0])
+    result = util.floats_to_fx10(values)
+    np.testing.assert_array_equal(result, scalar_fx10(values))
+    assert result.min() == -512 and result.max() == 511
+
+
+def test_floats_to_fx10_like_float_to_fx10():
+    rng = np.random.default_rng(3)
+    values = rng.uniform(-1.1, 1.1, 20000)
+    for dtype in (np.float64, np.float32):
+        array = values.astype(dtype)
+        np.testing.assert_array_equal(util.floats_to_fx10(array),
+                                      scalar_fx10(array))
+
+
+def test_transform_positions_like_matrix_multiplication():
+    rng = np.random.default_rng(4)
+    matrix = rng.uniform(-2, 2, (4, 4)).tolist()
+    matrix[3] = [0, 0, 0, 1]
+    positions = rng.uniform(-100, 100, (5000, 3)).astype(np.float32)
+    expected = [Matrix(matrix) @ Vector(v) for v in positions.tolist()]
+    np.testing.assert_array_equal(
+        util.transform_positions(Matrix(matrix), positions),
+        np.array(expected, dtype=np.float32))
+
+
+def test_rotate_normals_like_quaternion_multiplication():
+    rng = np.random.default_rng(5)
+    quaternion = Quaternion(rng.normal(size=4).tolist()).normalized()
+    normals = util.normalize_vectors(random_vectors(5000, seed=6))
+    expected = [quaternion @ Vector(v) for v in normals.tolist()]
+    np.testing.assert_array_equal(
+        util.rotate_normals(quaternion, normals),
+        np.array(expected, dtype=np.float32))
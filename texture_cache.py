@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from . import local_logger as logger
+
+
+# Change this when the format of the cached data changes.
+CACHE_VERSION = 1
+
+
+class TextureCache():
+    """
+    Stores converted textures in a directory. Entries are keyed by the
+    content of the texture file. A small key file for the real path, size
+    and modification time of the texture points to the entry, so the
+    content is only hashed when the texture is new or changed. The least
+    recently used files are removed when the directory grows larger than
+    size_limit bytes.
+    """
+    def __init__(self, directory, size_limit):
+        self.directory = directory
+        self.size_limit = size_limit
+        self.hits = 0
+        self.misses = 0
+        # Textures may be loaded from several threads.
+        self.lock = threading.Lock()
+
+    def get_key(self, path):
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        key = '\0'.join([str(CACHE_VERSION), path, str(stat.st_size),
+                         str(stat.st_mtime_ns)])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get_content_key(self, path):
+        content = hashlib.sha1(str(CACHE_VERSION).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                content.update(block)
+        return content.hexdigest()
+
+    def read_file(self, path, read):
+        """
+        Returns read(f) for the file at path and marks the file as
+        recently used, or None if it can't be read.
+        """
+        try:
+            with open(path, 'r') as f:
+                result = read(f)
+            os.utime(path)
+            return result
+        except (OSError, ValueError):
+            return None
+
+    def load(self, path, convert):
+        """
+        Returns the cached data of the texture at path. On a miss the data
+        is made with convert(path) and added to the cache.
+        """
+        key_path = os.path.join(self.directory, self.get_key(path) + '.key')
+        content_key = self.read_file(key_path, lambda f: f.read())
+        if content_key:
+            data = self.read_file(
+                os.path.join(self.directory, content_key + '.json'),
+                json.load)
+            if data is not None:
+                with self.lock:
+                    self.hits += 1
+                return data
+
+        # The texture is new or changed, or its entry was removed. Textures
+        # with the same content share an entry.
+        content_key = self.get_content_key(path)
+        entry_path = os.path.join(self.directory, content_key + '.json')
+        data = self.read_file(entry_path, json.load)
+        if data is not None:
+            with self.lock:
+                self.hits += 1
+                self.write_files([(key_path, content_key)])
+            return data
+
+        data = convert(path)
+        with self.lock:
+            self.misses += 1
+            self.write_files([(entry_path, json.dumps(data)),
+                              (key_path, content_key)])
+        return data
+
+    def write_files(self, files):
+        """
+        Writes the text of every (path, text) in files. Files are written
+        to a unique temporary file first, so other exports that use the
+        same directory never see a partly written file.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for path, text in files:
+                fd, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                                 dir=self.directory)
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        f.write(text)
+                    os.replace(temp_path, path)
+                except BaseException:
+                    os.remove(temp_path)
+                    raise
+            self.evict()
+        except OSError as e:
+            logger.warning(f"Could not write texture cache entry: {e}")
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(('.json', '.key')):
+                continue
+            # Other exports may remove entries at the same time.
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+            total_size += stat.st_size
+        entries.sort()
+        for _, path, size in entries:
+            if total_size <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
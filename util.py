@@ -1,4 +1,5 @@
 import bpy
+import numpy as np
 from mathutils import Vector
 
 
@@ -14,20 +15,20 @@ def get_color_from_obj(obj, idx):
         return obj.data.vertex_colors[0].data[idx].color
 
 
-def is_pos_s(vecfx32):
+def is_pos_s(xyz):
     return (
-        (vecfx32.x & 0x3F) == 0 and
-        (vecfx32.y & 0x3F) == 0 and
-        (vecfx32.z & 0x3F) == 0
+        (xyz[0] & 0x3F) == 0 and
+        (xyz[1] & 0x3F) == 0 and
+        (xyz[2] & 0x3F) == 0
     )
 
 
 def is_pos_diff(diff):
     # 512 is 0.125 in FX32
     return (
-        abs(diff.x) < 512 and
-        abs(diff.y) < 512 and
-        abs(diff.z) < 512
+        abs(diff[0]) < 512 and
+        abs(diff[1]) < 512 and
+        abs(diff[2]) < 512
     )
 
 
@@ -113,6 +114,70 @@ def float_to_fx10(value):
     return max(min(int(round(value * 512)), 511), -512)
 
 
+def floats_to_fx32(array):
+    """
+    Converts an array of floats to FX32, rounds like float_to_fx32.
+    """
+    return np.rint(np.asarray(array, dtype=np.float64) * 4096).astype(np.int64)
+
+
+def floats_to_fx10(array):
+    """
+    Converts an array of floats to FX10, rounds and clamps like
+    float_to_fx10.
+    """
+    fx10 = np.rint(np.asarray(array, dtype=np.float64) * 512)
+    return np.clip(fx10, -512, 511).astype(np.int64)
+
+
+def normalize_vectors(vectors):
+    """
+    Normalizes float32 vectors of shape (n, 3) like Vector.normalized: the
+    squared length is summed as doubles, the scale is a float. Vectors that
+    are too short to normalize become zero.
+    """
+    squares = vectors.astype(np.float64) ** 2
+    lengths = squares[:, 0] + squares[:, 1] + squares[:, 2]
+    valid = lengths > 1e-35
+    scales = np.zeros(len(vectors), dtype=np.float32)
+    scales[valid] = np.float32(1) / np.sqrt(lengths[valid]).astype(np.float32)
+    return vectors * scales[:, np.newaxis]
+
+
+def transform_positions(matrix, positions):
+    """
+    Multiplies float32 positions of shape (n, 3) by a 4x4 matrix. Like
+    mathutils, the products are floats and they are summed as doubles.
+    """
+    matrix = np.array(matrix, dtype=np.float32)
+    result = np.empty_like(positions)
+    for row in range(3):
+        dot = (matrix[row, 0] * positions[:, 0]).astype(np.float64)
+        dot += matrix[row, 1] * positions[:, 1]
+        dot += matrix[row, 2] * positions[:, 2]
+        dot += matrix[row, 3]
+        result[:, row] = dot
+    return result
+
+
+def rotate_normals(quaternion, normals):
+    """
+    Rotates float32 normals of shape (n, 3) by a quaternion, the same way
+    as mathutils does for a single vector.
+    """
+    w, x, y, z = np.array(quaternion, dtype=np.float32)
+    r0, r1, r2 = normals[:, 0], normals[:, 1], normals[:, 2]
+    t0 = -x * r0 - y * r1 - z * r2
+    t1 = w * r0 + y * r2 - z * r1
+    t2 = w * r1 + z * r0 - x * r2
+    r2 = w * r2 + x * r1 - y * r0
+    result = np.empty_like(normals)
+    result[:, 0] = t0 * -x + t1 * w - t2 * z + r2 * y
+    result[:, 1] = t0 * -y + t2 * w - r2 * x + t1 * z
+    result[:, 2] = t0 * -z + r2 * w - t1 * y + t2 * x
+    return result
+
+
 def fx10_to_float(value):
     return float(value) / 512
 
@@ -0,0 +1,115 @@
+import os
+
+
+def escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attrib(text):
+    text = escape_text(text).replace('"', '&quot;')
+    return text.replace('\r', '&#13;').replace('\n', '&#10;') \
+        .replace('\t', '&#09;')
+
+
+def escape_pretty(text):
+    return escape_text(text).replace('"', '&quot;')
+
+
+class XMLWriter():
+    """
+    Writes an XML file one element at a time, so the whole document never
+    has to be in memory. Elements are opened and closed with start and end,
+    or written at once from an ElementTree element with write. The output
+    is the same as ElementTree.tostring, or as minidom's toprettyxml when
+    pretty_print is set. The file is written to a temporary path and only
+    replaces path when the writer is closed without an error.
+    """
+    def __init__(self, path, pretty_print, indent='   '):
+        self.path = path
+        self.temp_path = path + '.tmp'
+        self.pretty_print = pretty_print
+        self.indent = indent
+        self.file = open(self.temp_path, 'w', buffering=1 << 16)
+        # Tags of the open elements.
+        self.stack = []
+        # Whether the start tag of the last opened element isn't closed yet.
+        self.pending = False
+        # Number of elements written.
+        self.element_count = 0
+        if pretty_print:
+            self.file.write('<?xml version="1.0" ?>\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+    def write_start_tag(self, tag, attrib):
+        self.close_start_tag()
+        self.element_count += 1
+        if self.pretty_print:
+            self.file.write(self.indent * len(self.stack))
+            attrs = ''.join([f' {k}="{escape_pretty(v)}"'
+                             for k, v in attrib.items()])
+        else:
+            attrs = ''.join([f' {k}="{escape_attrib(v)}"'
+                             for k, v in attrib.items()])
+        self.file.write(f'<{tag}{attrs}')
+
+    def close_start_tag(self):
+        if self.pending:
+            self.file.write('>\n' if self.pretty_print else '>')
+            self.pending = False
+
+    def start(self, tag, attrib=None):
+        """
+        Opens an element, its children are written until end is called.
+        """
+        self.write_start_tag(tag, attrib or {})
+        self.stack.append(tag)
+        self.pending = True
+
+    def end(self):
+        tag = self.stack.pop()
+        if self.pending:
+            self.file.write('/>\n' if self.pretty_print else ' />')
+            self.pending = False
+        elif self.pretty_print:
+            self.file.write(f'{self.indent * len(self.stack)}</{tag}>\n')
+        else:
+            self.file.write(f'</{tag}>')
+
+    def write(self, element):
+        """
+        Writes an ElementTree element and its children.
+        """
+        if not element.text and not len(element):
+            self.start(element.tag, element.attrib)
+            self.end()
+            return
+        self.write_start_tag(element.tag, element.attrib)
+        if not len(element):
+            # Text only elements are written on one line.
+            text = element.text
+            if self.pretty_print:
+                self.file.write(f'>{escape_pretty(text)}</{element.tag}>\n')
+            else:
+                self.file.write(f'>{escape_text(text)}</{element.tag}>')
+            return
+        self.stack.append(element.tag)
+        self.pending = True
+        if element.text:
+            self.close_start_tag()
+            if self.pretty_print:
+                indent = self.indent * len(self.stack)
+                self.file.write(f'{indent}{escape_pretty(element.text)}\n')
+            else:
+                self.file.write(escape_text(element.text))
+        for child in element:
+            self.write(child)
+        self.end()